@@ -0,0 +1,274 @@
+"""
+Replays a synthetic corpus of Alexa events through lambda_function.lambda_handler and reports
+p50/p95/p99 latency per intent, cold against warm start, and peak RSS.
+ProPublica is replaced by a stub server on localhost, so runs are repeatable and need no network.
+
+The corpus covers LaunchRequest, SessionEndedRequest, help, and all three record intents,
+each asked with exact, partial (last name only), misheard, ambiguous and unknown names.
+Names are looked up afresh on every request, rather than answered from getCongressId's memo.
+
+    python benchmark.py [--iterations 20] [--cold-starts 5] [--upstream-latency 50] [--cold-cache]
+"""
+
+from __future__ import print_function
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+import lambda_function
+
+
+# --------------- Stub ProPublica server ----------------------
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    '''
+    Answers every vote comparison with made up, but stable, counts after server.latency seconds.
+    Speaks HTTP/1.1 so the skill's pooled connections are kept alive, as they would be against ProPublica.
+    '''
+    protocol_version = 'HTTP/1.1'
+    #headers and body are separate writes; with Nagle on, every reused connection would wait ~40 ms on a delayed ACK
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        common = 100 + sum(ord(character) for character in self.path) % 400
+        body = json.dumps({'status': 'OK', 'results': [{'common_votes': common, 'disagree_votes': common // 5}]})
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub(latency):
+    server = StubServer(('127.0.0.1', 0), StubHandler)
+    server.latency = latency
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def stub_url(server):
+    return 'http://127.0.0.1:{0}/congress/v1'.format(server.server_port)
+
+
+# --------------- Event corpus ----------------------
+
+def event(request, new=True):
+    return {
+        'session': {
+            'new': new,
+            'sessionId': 'benchmark-session',
+            'application': {'applicationId': 'benchmark'},
+            'attributes': {},
+        },
+        'request': dict(request, requestId='benchmark-request'),
+    }
+
+
+def intent_event(name, slots):
+    return event({'type': "IntentRequest",
+                  'intent': {'name': name, 'slots': dict((slot, {'name': slot, 'value': value})
+                                                        for slot, value in slots.items())}})
+
+
+def misheard(name, generator):
+    '''
+    name with a vowel of its first and last words swapped for another, the way speech recognition
+    slips ('Nancie Polosi').
+    '''
+    words = name.lower().split(' ')
+    for number in (0, -1):
+        vowels = [position for position, letter in enumerate(words[number]) if letter in 'aeiou']
+        if vowels:
+            position = generator.choice(vowels)
+            letter = generator.choice([vowel for vowel in 'aeiou' if vowel != words[number][position]])
+            words[number] = words[number][:position] + letter + words[number][position + 1:]
+    return ' '.join(words)
+
+
+def names(seed):
+    '''
+    A few names of each kind, drawn from the loaded member index:
+        exact:      official full names
+        partial:    last names only one member has, which the partial lookup answers
+        misheard:   near misses the exact and partial tables can't settle, so they go to lookup_fuzzy
+        ambiguous:  last or first names several members share
+        unknown:    nothing like anyone
+    '''
+    generator = random.Random(seed)
+    currentMembers = lambda_function.CURRENT_MEMBERS.get()
+    exact = [full for (ID, full) in generator.sample(filter(None, currentMembers.entries), 6)]
+    partial = [key for key, positions in sorted(currentMembers.last.items()) if len(positions) == 1]
+    ambiguous = [key for key, positions in sorted(currentMembers.last.items()) if len(positions) > 3]
+
+    #kept only if neither the exact nor the partial lookup can settle them alone
+    heard = []
+    for (ID, full) in generator.sample(filter(None, currentMembers.entries), 40):
+        name = misheard(full, generator)
+        words = name.split(' ')
+        if not currentMembers.lookup_exact(name) and len(currentMembers.lookup_partial(name, words[0], words[-1])) != 1:
+            heard.append(name)
+        if len(heard) == 6:
+            break
+    return {
+        'exact': exact,
+        'partial': generator.sample(partial, 4),
+        'misheard': heard,
+        'ambiguous': generator.sample(ambiguous, 2) + ['john'],
+        'unknown': ['zzz qqq', 'nobody in particular'],
+    }
+
+
+def build_corpus(seed):
+    '''
+    (label, event) pairs, where label is the intent or request type the latency is reported under.
+    '''
+    corpus = [
+        ('LaunchRequest', event({'type': "LaunchRequest"})),
+        ('SessionEndedRequest', event({'type': "SessionEndedRequest", 'reason': 'USER_INITIATED'}, new=False)),
+        ('AMAZON.HelpIntent', intent_event("AMAZON.HelpIntent", {})),
+    ]
+    kinds = names(seed)
+    for kind, values in sorted(kinds.items()):
+        for value in values:
+            corpus.append(('generalRecordCheck', intent_event("generalRecordCheck", {'congressman': value})))
+            corpus.append(('indivCommitteeCheck', intent_event("indivCommitteeCheck", {'congressman': value})))
+    for first, second in zip(kinds['exact'], kinds['exact'][1:] + kinds['misheard'][:1]):
+        corpus.append(('recordCompare', intent_event("recordCompare", {'congressmanOne': first,
+                                                                       'congressmanTwo': second})))
+    corpus.append(('recordCompare', intent_event("recordCompare", {'congressmanOne': kinds['exact'][0],
+                                                                   'congressmanTwo': kinds['unknown'][0]})))
+    return corpus
+
+
+# --------------- Measurement ----------------------
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def peak_rss_mb():
+    #ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def run_warm(corpus, iterations, coldCache):
+    latencies = {}
+    with open(os.devnull, 'w') as devnull:
+        stdout = sys.stdout
+        sys.stdout = devnull
+        try:
+            for iteration in range(iterations):
+                for label, request in corpus:
+                    if coldCache:
+                        lambda_function.VOTE_CACHE.entries.clear()
+                    #otherwise every pass after the first is a memo hit, and name lookup itself goes unmeasured
+                    lambda_function.CURRENT_MEMBERS.get().resolved.clear()
+                    started = time.time()
+                    lambda_function.lambda_handler(request, None)
+                    latencies.setdefault(label, []).append((time.time() - started) * 1000)
+        finally:
+            sys.stdout = stdout
+    return latencies
+
+
+COLD_CHILD = '''
+import json, os, resource, sys, time
+started = time.time()
+import lambda_function
+imported = time.time()
+lambda_function.PROPUBLICA = lambda_function.propublica_client(sys.argv[1])
+lambda_function.VOTE_CACHE.directory = ''
+request = json.loads(sys.argv[2])
+stdout = sys.stdout
+sys.stdout = open(os.devnull, 'w')
+lambda_function.lambda_handler(request, None)
+finished = time.time()
+sys.stdout = stdout
+print(json.dumps({'importMs': (imported - started) * 1000, 'firstRequestMs': (finished - imported) * 1000,
+                  'peakRssMb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0}))
+'''
+
+
+def run_cold(request, count, url):
+    '''
+    Each cold start is a fresh interpreter that imports lambda_function and answers one request.
+    '''
+    request = json.dumps(request)
+    results = []
+    for number in range(count):
+        output = subprocess.check_output([sys.executable, '-c', COLD_CHILD, url, request],
+                                         cwd=lambda_function.DATA_DIR)
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return results
+
+
+def report(latencies, coldStarts):
+    print("{0:<22}{1:>8}{2:>10}{3:>10}{4:>10}".format('request', 'count', 'p50 ms', 'p95 ms', 'p99 ms'))
+    for label in sorted(latencies):
+        values = latencies[label]
+        print("{0:<22}{1:>8}{2:>10.2f}{3:>10.2f}{4:>10.2f}".format(
+            label, len(values), percentile(values, 0.5), percentile(values, 0.95), percentile(values, 0.99)))
+
+    if coldStarts:
+        importMs = [result['importMs'] for result in coldStarts]
+        firstMs = [result['firstRequestMs'] for result in coldStarts]
+        print("\ncold start, over {0} fresh interpreters:".format(len(coldStarts)))
+        print("  import (data load) p50 {0:.2f} ms, max {1:.2f} ms".format(percentile(importMs, 0.5), max(importMs)))
+        print("  first request      p50 {0:.2f} ms, max {1:.2f} ms".format(percentile(firstMs, 0.5), max(firstMs)))
+        print("  peak RSS           {0:.1f} MB".format(max(result['peakRssMb'] for result in coldStarts)))
+
+    warm = [value for label in latencies if label != 'recordCompare' for value in latencies[label]]
+    if warm:
+        print("\nwarm start, all local intents: p50 {0:.3f} ms, p99 {1:.3f} ms".format(
+            percentile(warm, 0.5), percentile(warm, 0.99)))
+    print("peak RSS of this process: {0:.1f} MB".format(peak_rss_mb()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=20, help="passes over the corpus, warm")
+    parser.add_argument('--cold-starts', type=int, default=5, help="fresh interpreters to time, 0 to skip")
+    parser.add_argument('--upstream-latency', type=float, default=50, help="stub response delay in ms")
+    parser.add_argument('--cold-cache', action='store_true', help="empty the vote cache before every request")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    server = start_stub(args.upstream_latency / 1000.0)
+    lambda_function.PROPUBLICA = lambda_function.propublica_client(stub_url(server))
+    lambda_function.VOTE_CACHE.directory = ''
+
+    corpus = build_corpus(args.seed)
+    #an exact name, so the first request is the common case rather than the unknown name's suggestions
+    first = intent_event("generalRecordCheck", {'congressman': names(args.seed)['exact'][0]})
+    coldStarts = run_cold(first, args.cold_starts, stub_url(server))
+    latencies = run_warm(corpus, args.iterations, args.cold_cache)
+    report(latencies, coldStarts)
+
+    #closing the pooled connections ends the stub's keep-alive threads, rather than leaving them
+    #to die mid-read as the interpreter shuts down
+    lambda_function.PROPUBLICA.close()
+    server.shutdown()
+    server.server_close()
+
+
+if __name__ == '__main__':
+    main()
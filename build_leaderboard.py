@@ -0,0 +1,217 @@
+"""
+Precomputes how often members vote together, so the skill can answer "who does X vote with most?"
+and "how aligned is committee Y?" with a single lookup. Writes leaderboard.json beside lambda_function.
+
+Agreement is summed over the chosen congresses, by default the newest one the member data reaches.
+For each congress and house:
+    with a roll-call matrix (see build_vote_matrix.py), every pair in the chamber is scored in one pass
+    without one, only pairs sharing a committee are scored, from ProPublica through VOTE_CACHE
+
+Scores are kept per congress and house in leaderboard_state.pickle, so reruns are incremental:
+a matrix is only rescored when its files change, pairs from closed congresses are never fetched again,
+and in the current congress only pairs that are new or whose cached comparison has expired go upstream.
+Point VOTE_CACHE_DIR somewhere lasting to keep those cached comparisons between runs.
+
+    python build_leaderboard.py [--congress 115] [--top 5] [--min-votes 20] [--workers 8]
+"""
+
+from __future__ import print_function
+import argparse
+import cPickle as pickle
+import hashlib
+import json
+import os
+import Queue
+import threading
+
+import lambda_function
+
+
+STATE_PATH = os.path.join(lambda_function.DATA_DIR, 'leaderboard_state.pickle')
+
+
+def load_state(path):
+    try:
+        with open(path, 'rb') as data:
+            return pickle.load(data)
+    except (IOError, EOFError, pickle.UnpicklingError):
+        return {'sessions': {}}
+
+
+def matrix_fingerprint(congress, house):
+    digest = hashlib.sha1()
+    base = os.path.join(lambda_function.VOTE_MATRIX_DIR, '{0}-{1}'.format(congress, house))
+    for suffix in ('.npy', '.json'):
+        with open(base + suffix, 'rb') as data:
+            digest.update(data.read())
+    return digest.hexdigest()
+
+
+def score_matrix(matrix):
+    '''
+    (common_votes, disagree_votes) for every pair of members in the matrix who ever voted together.
+    '''
+    (common, disagree) = matrix.agreement()
+    pairs = {}
+    for row in range(len(matrix.members)):
+        for column in range(row + 1, len(matrix.members)):
+            if common[row, column] > 0:
+                pair = tuple(sorted((matrix.members[row], matrix.members[column])))
+                pairs[pair] = (int(common[row, column]), int(disagree[row, column]))
+    return pairs
+
+
+def committee_pairs(currentMembers, committeeMembers, congress, house):
+    '''
+    Every pair of current members who share a committee and both sat in house during congress.
+    '''
+    pairs = set()
+    for committee, sides in committeeMembers.byCommittee.items():
+        IDs = sorted(set(assignment.bioguide for side in sides.values() for assignment in side
+                         if assignment.bioguide in currentMembers.byId))
+        for position, ID1 in enumerate(IDs):
+            for ID2 in IDs[position + 1:]:
+                if (congress, house) in lambda_function.shared_service(currentMembers.byId[ID1],
+                                                                       currentMembers.byId[ID2]):
+                    pairs.add((ID1, ID2))
+    return pairs
+
+
+def score_propublica(pairs, previous, congress, house, workers):
+    '''
+    Scores pairs from ProPublica, reusing previous scores wherever the underlying data can't have changed.
+    '''
+    scores = {}
+    pending = Queue.Queue()
+    for pair in pairs:
+        if pair in previous and congress < lambda_function.current_congress():
+            scores[pair] = previous[pair]
+        else:
+            pending.put(pair)
+    print("{0} {1}: {2} pairs, {3} to fetch".format(congress, house, len(pairs), pending.qsize()))
+
+    def worker():
+        while True:
+            try:
+                (ID1, ID2) = pending.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                scores[(ID1, ID2)] = lambda_function.fetch_vote_comparison(ID1, ID2, congress, house)
+            except (IOError, ValueError, KeyError, IndexError) as error:
+                print("comparison failed for {0}/{1} in {2} {3}: {4!r}".format(ID1, ID2, congress, house, error))
+                if (ID1, ID2) in previous:
+                    scores[(ID1, ID2)] = previous[(ID1, ID2)]
+
+    threads = [threading.Thread(target=worker) for number in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return scores
+
+
+def score_session(state, currentMembers, committeeMembers, congress, house, workers):
+    previous = state['sessions'].get((congress, house), {'fingerprint': None, 'pairs': {}})
+    matrix = lambda_function.load_vote_matrix(congress, house)
+
+    if matrix is not None:
+        fingerprint = matrix_fingerprint(congress, house)
+        if fingerprint == previous['fingerprint']:
+            print("{0} {1}: matrix unchanged, keeping {2} pairs".format(congress, house, len(previous['pairs'])))
+            return previous
+        pairs = score_matrix(matrix)
+        print("{0} {1}: scored {2} pairs from the roll-call matrix".format(congress, house, len(pairs)))
+        return {'fingerprint': fingerprint, 'pairs': pairs}
+
+    if congress < lambda_function.PROPUBLICA_FIRST_CONGRESS[house]:
+        return previous
+    pairs = committee_pairs(currentMembers, committeeMembers, congress, house)
+    #scores carried over from a matrix that has since been removed can't be trusted to be comparable
+    carried = previous['pairs'] if previous['fingerprint'] is None else {}
+    return {'fingerprint': None, 'pairs': score_propublica(pairs, carried, congress, house, workers)}
+
+
+def percent(common, disagree):
+    return int(round(100.0 * (common - disagree) / common))
+
+
+def build_leaderboard(state, congresses, committeeMembers, top, minVotes):
+    '''
+    The table the skill reads:
+        members:        bioguide -> [[partner, percent agreed, common votes], ...], top partners first
+        committees:     committee -> {'agreement', 'pairs', 'closest', 'furthest'},
+                        where closest and furthest are [bioguide, bioguide, percent agreed]
+        committeeOnly:  whether any congress was scored without a roll-call matrix, so only among committee-mates
+    Pairs with fewer than minVotes shared votes are left out.
+    '''
+    totals = {}
+    committeeOnly = False
+    for (congress, house), session in state['sessions'].items():
+        if congress not in congresses:
+            continue
+        if session['fingerprint'] is None and session['pairs']:
+            committeeOnly = True
+        for pair, (common, disagree) in session['pairs'].items():
+            total = totals.setdefault(pair, [0, 0])
+            total[0] += common
+            total[1] += disagree
+    totals = dict((pair, total) for pair, total in totals.items() if total[0] >= minVotes)
+
+    members = {}
+    for (ID1, ID2), (common, disagree) in totals.items():
+        members.setdefault(ID1, []).append([ID2, percent(common, disagree), common])
+        members.setdefault(ID2, []).append([ID1, percent(common, disagree), common])
+    for ID in members:
+        members[ID].sort(key=lambda partner: (-partner[1], -partner[2], partner[0]))
+        members[ID] = members[ID][:top]
+
+    committees = {}
+    for committee, sides in committeeMembers.byCommittee.items():
+        IDs = sorted(set(assignment.bioguide for side in sides.values() for assignment in side))
+        scored = [((ID1, ID2), totals[(ID1, ID2)]) for position, ID1 in enumerate(IDs)
+                  for ID2 in IDs[position + 1:] if (ID1, ID2) in totals]
+        if len(scored) == 0:
+            continue
+        ranked = sorted(scored, key=lambda item: (-percent(*item[1]), item[0]))
+        committees[committee] = {
+            'agreement': percent(sum(total[0] for pair, total in scored), sum(total[1] for pair, total in scored)),
+            'pairs': len(scored),
+            'closest': list(ranked[0][0]) + [percent(*ranked[0][1])],
+            'furthest': list(ranked[-1][0]) + [percent(*ranked[-1][1])],
+        }
+
+    return {'congresses': sorted(congresses), 'members': members, 'committees': committees,
+            'committeeOnly': committeeOnly}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--congress', type=int, action='append', default=[],
+                        help="congress to score, may be repeated (defaults to the newest one in the member data)")
+    parser.add_argument('--top', type=int, default=5, help="partners kept per member")
+    parser.add_argument('--min-votes', type=int, default=20, help="fewest shared votes a pair is ranked on")
+    parser.add_argument('--workers', type=int, default=lambda_function.BATCH_CONCURRENCY)
+    parser.add_argument('--state', default=STATE_PATH)
+    parser.add_argument('--output', default=lambda_function.LEADERBOARD.path)
+    args = parser.parse_args()
+
+    currentMembers = lambda_function.CURRENT_MEMBERS.get()
+    committeeMembers = lambda_function.COMMITTEE_MEMBERS.get()
+    congresses = set(args.congress or [lambda_function.latest_congress(currentMembers)])
+
+    state = load_state(args.state)
+    for congress in sorted(congresses):
+        for house in ('house', 'senate'):
+            state['sessions'][(congress, house)] = score_session(
+                state, currentMembers, committeeMembers, congress, house, args.workers)
+    lambda_function.write_atomically(args.state, lambda output: pickle.dump(state, output, pickle.HIGHEST_PROTOCOL))
+
+    leaderboard = build_leaderboard(state, congresses, committeeMembers, args.top, args.min_votes)
+    lambda_function.write_atomically(args.output, lambda output: json.dump(leaderboard, output, separators=(',', ':')))
+    print("wrote {0}: {1} members, {2} committees".format(
+        args.output, len(leaderboard['members']), len(leaderboard['committees'])))
+
+
+if __name__ == '__main__':
+    main()
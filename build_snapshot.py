@@ -0,0 +1,28 @@
+"""
+Builds data_snapshot.json, the precomputed form of current_members.json and committee_members.json
+that lambda_function loads at import instead of parsing and indexing the JSON.
+It holds only the indexes the handlers read. Rerun it whenever either JSON file changes;
+a snapshot that no longer matches its JSON is ignored until then.
+
+    python build_snapshot.py [--output data_snapshot.json]
+"""
+
+from __future__ import print_function
+import argparse
+import os
+
+import lambda_function
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', default=lambda_function.SNAPSHOT.path)
+    args = parser.parse_args()
+
+    snapshot = lambda_function.build_snapshot()
+    lambda_function.write_atomically(args.output, lambda output: output.write(lambda_function.dump_snapshot(snapshot)))
+    print("wrote {0} ({1} bytes)".format(args.output, os.path.getsize(args.output)))
+
+
+if __name__ == '__main__':
+    main()
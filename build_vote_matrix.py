@@ -0,0 +1,118 @@
+"""
+Builds the roll-call matrices that lambda_function answers comparisons from when VOTE_SOURCE=local.
+Each congress and house becomes a pair of files in VOTE_MATRIX_DIR (see VoteMatrix):
+    {congress}-{house}.npy   members x votes int8 array, 1 yea / -1 nay / 0 otherwise
+    {congress}-{house}.json  bioguide ID of each row
+
+    python build_vote_matrix.py voteview HSall_votes.csv
+        converts Voteview's member votes CSV, keeping only currently serving members
+    python build_vote_matrix.py fixture --congress 115 --votes 600
+        writes a seeded random matrix over the current members, for local testing
+"""
+
+from __future__ import print_function
+import argparse
+import csv
+import json
+import os
+import random
+
+import numpy
+
+import lambda_function
+
+
+#Voteview cast codes: 1-3 are forms of yea, 4-6 forms of nay, 7-9 present or not voting
+CAST_CODES = {1: 1, 2: 1, 3: 1, 4: -1, 5: -1, 6: -1}
+CHAMBERS = {'House': 'house', 'Senate': 'senate'}
+
+
+def write_matrix(directory, congress, house, members, votes):
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    base = os.path.join(directory, '{0}-{1}'.format(congress, house))
+    numpy.save(base + '.npy', numpy.asarray(votes, dtype=numpy.int8))
+    with open(base + '.json', 'w') as data:
+        json.dump(members, data)
+    print("wrote {0}.npy: {1} members x {2} votes".format(base, len(members), len(votes[0]) if members else 0))
+
+
+def from_voteview(path, directory, congresses):
+    '''
+    Reads a Voteview member votes CSV (congress, chamber, rollnumber, icpsr, cast_code, ...)
+    and writes one matrix per congress and house found in it.
+    '''
+    with open(os.path.join(lambda_function.DATA_DIR, 'current_members.json')) as data:
+        byIcpsr = dict((element['id']['icpsr'], element['id']['bioguide'])
+                       for element in json.load(data) if 'icpsr' in element['id'])
+
+    #(congress, house) -> {bioguide: {rollnumber: vote}}
+    sessions = {}
+    with open(path) as data:
+        for row in csv.DictReader(data):
+            congress = int(row['congress'])
+            if row['chamber'] not in CHAMBERS or (congresses and congress not in congresses):
+                continue
+            ID = byIcpsr.get(int(float(row['icpsr'])))
+            if ID is None:
+                continue
+            session = sessions.setdefault((congress, CHAMBERS[row['chamber']]), {})
+            session.setdefault(ID, {})[int(row['rollnumber'])] = CAST_CODES.get(int(float(row['cast_code'])), 0)
+
+    for (congress, house), session in sorted(sessions.items()):
+        members = sorted(session)
+        rollCalls = sorted(set(number for votes in session.values() for number in votes))
+        votes = [[session[ID].get(number, 0) for number in rollCalls] for ID in members]
+        write_matrix(directory, congress, house, members, votes)
+
+
+def fixture(directory, congresses, voteCount, seed):
+    '''
+    A random but party-shaped matrix: on each roll call most of each party votes the party line,
+    a few cross over and a few don't vote, so agreement rates look like the real thing.
+    '''
+    generator = random.Random(seed)
+    with open(os.path.join(lambda_function.DATA_DIR, 'current_members.json')) as data:
+        currentMembers = json.load(data)
+
+    for congress in congresses:
+        for house, termType in (('house', 'rep'), ('senate', 'sen')):
+            chamber = [(element['id']['bioguide'], element['terms'][-1]['party'])
+                       for element in currentMembers if element['terms'][-1]['type'] == termType]
+            chamber.sort()
+            votes = [[] for member in chamber]
+            for number in range(voteCount):
+                line = {'Democrat': generator.choice((1, -1)), 'Republican': generator.choice((1, -1))}
+                for row, (ID, party) in enumerate(chamber):
+                    roll = generator.random()
+                    vote = line.get(party, generator.choice((1, -1)))
+                    if roll < 0.03:
+                        vote = 0
+                    elif roll < 0.12:
+                        vote = -vote
+                    votes[row].append(vote)
+            write_matrix(directory, congress, house, [ID for (ID, party) in chamber], votes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('source', choices=('voteview', 'fixture'))
+    parser.add_argument('path', nargs='?', help="Voteview CSV, for the voteview source")
+    parser.add_argument('--congress', type=int, action='append', default=[],
+                        help="congress to build, may be repeated (fixture defaults to the newest in the member data)")
+    parser.add_argument('--votes', type=int, default=600, help="roll calls per fixture matrix")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=lambda_function.VOTE_MATRIX_DIR)
+    args = parser.parse_args()
+
+    if args.source == 'voteview':
+        if args.path is None:
+            parser.error("the voteview source needs the path to a votes CSV")
+        from_voteview(args.path, args.output, set(args.congress))
+    else:
+        fixture(args.output, args.congress or [lambda_function.latest_congress(lambda_function.CURRENT_MEMBERS.get())],
+                args.votes, args.seed)
+
+
+if __name__ == '__main__':
+    main()
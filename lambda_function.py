@@ -9,8 +9,1214 @@ For publishing on the Amazon Alexa store.
 """
 
 from __future__ import print_function
-from urllib2 import Request, urlopen, URLError
+from collections import OrderedDict
+from contextlib import contextmanager
+import bisect
+import datetime
+import hashlib
+import httplib
 import json
+import os
+import Queue
+import random
+import socket
+import stat
+import threading
+import time
+import unicodedata
+import urlparse
+import zlib
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+
+# --------------- Request timing ----------------------
+
+#fraction of requests that log a timing line, 0 (the default) turns timing off entirely
+TIMING_SAMPLE_RATE = float(os.environ.get('TIMING_SAMPLE_RATE', 0))
+
+
+class RequestTiming(object):
+    '''
+    Milliseconds spent in each phase of one request, plus counters for things like cache hits.
+    Phases with the same name add up, so 'resolve' covers every name looked up in the request.
+    emit() prints it all as a single JSON line for the log.
+    '''
+
+    def __init__(self, intent, coldStart):
+        self.intent = intent
+        self.coldStart = coldStart
+        self.started = time.time()
+        self.phases = OrderedDict()
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        started = time.time()
+        try:
+            yield
+        finally:
+            elapsed = (time.time() - started) * 1000
+            with self.lock:
+                self.phases[name] = self.phases.get(name, 0) + elapsed
+
+    def count(self, name):
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def emit(self):
+        print(json.dumps({
+            'timing': True,
+            'intent': self.intent,
+            'coldStart': self.coldStart,
+            'totalMs': round((time.time() - self.started) * 1000, 2),
+            'phasesMs': OrderedDict((name, round(elapsed, 2)) for name, elapsed in self.phases.items()),
+            'counts': self.counts,
+        }))
+
+
+class NullTiming(object):
+    '''
+    Stands in for RequestTiming on requests that weren't sampled, doing nothing as cheaply as possible.
+    '''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        return False
+
+    def phase(self, name):
+        return self
+
+    def count(self, name):
+        pass
+
+
+NULL_TIMING = NullTiming()
+#each thread handling a request (and each thread it fetches on) sees that request's timing here
+TIMING = threading.local()
+coldStart = True
+
+
+def timing():
+    return getattr(TIMING, 'current', NULL_TIMING)
+
+
+def start_timing(event):
+    global coldStart
+    requestTiming = NULL_TIMING
+    if TIMING_SAMPLE_RATE > 0 and random.random() < TIMING_SAMPLE_RATE:
+        request = event['request']
+        intent = request['intent']['name'] if request['type'] == "IntentRequest" else request['type']
+        requestTiming = RequestTiming(intent, coldStart)
+        if coldStart:
+            requestTiming.phases['initLoad'] = INIT_LOAD_MS
+    coldStart = False
+    TIMING.current = requestTiming
+    return requestTiming
+
+
+def finish_timing(requestTiming):
+    TIMING.current = NULL_TIMING
+    if requestTiming is not NULL_TIMING:
+        requestTiming.emit()
+
+
+# --------------- Datasets shared across warm invocations ----------------------
+
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class DataFile(object):
+    '''
+    A dataset that is parsed once per container and then shared by every request.
+    get() stats the file on each call; only if the mtime moved is the file re-hashed,
+    and only if the hash changed is it re-parsed. A warm request costs a single os.stat.
+    load turns the open file into data (JSON by default), and if build is given,
+    it is run over that and its result is what get() hands out. build runs before the file is closed,
+    so load can hand it an iterator (like iter_members) that parses the file as build consumes it.
+    '''
+
+    def __init__(self, filename, build=None, load=json.load):
+        self.path = os.path.join(DATA_DIR, filename)
+        self.build = build
+        self.load = load
+        self.mtime = None
+        self.digest = None
+        self.data = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        mtime = os.stat(self.path).st_mtime
+        if self.data is not None and mtime == self.mtime:
+            return self.data
+
+        with self.lock:
+            if self.data is None or mtime != self.mtime:
+                with open(self.path, 'rb') as source:
+                    digest = file_digest(source)
+                    #a touched but otherwise identical file keeps the already parsed copy
+                    if self.data is None or digest != self.digest:
+                        source.seek(0)
+                        data = self.load(source)
+                        if self.build is not None:
+                            data = self.build(data)
+                        self.data = data
+                        self.digest = digest
+                self.mtime = mtime
+        return self.data
+
+
+def file_digest(source):
+    '''
+    sha1 of an open file, read a block at a time so the file is never held whole.
+    '''
+    digest = hashlib.sha1()
+    for block in iter(lambda: source.read(1 << 16), b''):
+        digest.update(block)
+    return digest.hexdigest()
+
+
+def write_atomically(path, write):
+    '''
+    Calls write with a file open beside path, then renames it over path, so readers (DataFile, the vote cache)
+    never see half a file. The temporary name is this process's and thread's own, so concurrent writers
+    of the same path don't clobber each other; the last rename wins.
+    '''
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            #another writer made it first
+            if not os.path.isdir(directory):
+                raise
+    temporary = '{0}.{1}.{2}.tmp'.format(path, os.getpid(), threading.current_thread().ident)
+    try:
+        with open(temporary, 'wb') as output:
+            write(output)
+        os.rename(temporary, path)
+    finally:
+        #only still there if writing or renaming failed
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+
+def iter_members(source):
+    '''
+    The records of current_members.json, one at a time. With ijson installed each is parsed
+    only as it's asked for, so no more than one raw record is ever in memory at once;
+    without it the whole list is parsed up front, which is quicker but peaks far higher.
+    '''
+    if ijson is None:
+        return iter(json.load(source))
+    return ijson.items(source, 'item')
+
+
+def iter_committees(source):
+    '''
+    (committee, members) for each committee in committee_members.json, one at a time, like iter_members.
+    '''
+    if ijson is None:
+        return json.load(source).iteritems()
+    return ijson.kvitems(source, '')
+
+
+def congress_of(date):
+    '''
+    The number of the congress sitting on a date. Each one opens on January 3rd of an odd year.
+    '''
+    year = date.year
+    if (date.month, date.day) < (1, 3):
+        year -= 1
+    if year % 2 == 0:
+        year -= 1
+    return (year - 1789) // 2 + 1
+
+
+def current_congress():
+    return congress_of(datetime.date.today())
+
+
+def latest_congress(currentMembers):
+    '''
+    The newest congress the member data reaches; the current one, unless the data is stale.
+    Only House terms are counted, since each lasts a single congress where a Senate term runs three.
+    '''
+    return min(current_congress(), max(last for record in currentMembers.byId.values()
+                                       for (first, last, house) in record.service if house == 'house'))
+
+
+def service_intervals(terms):
+    '''
+    Turns a member's terms into (first congress, last congress, house) intervals, oldest first,
+    with back to back terms in the same house merged. A term ending on the day the next congress opens
+    doesn't count toward it. Terms run to their scheduled end, even past today; shared_service()
+    stops at the current congress when it's asked, so a snapshot doesn't go stale as congresses turn over.
+    '''
+    intervals = []
+    for term in terms:
+        house = 'senate' if term['type'] == 'sen' else 'house'
+        start = datetime.datetime.strptime(term['start'], '%Y-%m-%d').date()
+        end = datetime.datetime.strptime(term['end'], '%Y-%m-%d').date() - datetime.timedelta(days=1)
+        first = congress_of(start)
+        last = congress_of(max(start, end))
+        if first > last:
+            continue
+        if intervals and intervals[-1][2] == house and intervals[-1][1] >= first - 1:
+            intervals[-1] = (intervals[-1][0], max(intervals[-1][1], last), house)
+        else:
+            intervals.append((first, last, house))
+    return tuple(intervals)
+
+
+def shared_service(record1, record2):
+    '''
+    Every (congress, house) the two members sat in together, up to the current congress and newest first,
+    found by intersecting their service intervals.
+    '''
+    sessions = set()
+    current = current_congress()
+    for (first1, last1, house1) in record1.service:
+        for (first2, last2, house2) in record2.service:
+            if house1 == house2:
+                sessions.update((congress, house1) for congress in
+                                range(max(first1, first2), min(last1, last2, current) + 1))
+    return sorted(sessions, reverse=True)
+
+
+class MemberRecord(object):
+    '''
+    The handful of derived fields the handlers read about a member, computed once at load time.
+        name:     'first last'
+        elected:  year of the first term's start
+        state, party:  from the most recent term
+        house:    (house terms, senate terms), both as strings
+        service:  the congresses served in each house, see service_intervals()
+    '''
+    __slots__ = ('bioguide', 'name', 'elected', 'state', 'party', 'house', 'service')
+
+    def __init__(self, element):
+        terms = element['terms']
+        self.bioguide = element['id']['bioguide']
+        self.name = element['name']['first'] + ' ' + element['name']['last']
+        self.elected = terms[0]['start'][0:4]
+        self.state = terms[-1]['state']
+        self.party = terms[-1]['party']
+
+        houseCount = [0, 0]
+        for term in terms:
+            if term['type'] == 'rep':
+                houseCount[0] += 1
+            elif term['type'] == 'sen':
+                houseCount[1] += 1
+        self.house = (str(houseCount[0]), str(houseCount[1]))
+        self.service = service_intervals(terms)
+
+    def dump(self):
+        return [getattr(self, field) for field in self.__slots__]
+
+    @classmethod
+    def restore(cls, state):
+        record = cls.__new__(cls)
+        (record.bioguide, record.name, record.elected, record.state, record.party, house, service) = state
+        record.house = tuple(house)
+        record.service = tuple(tuple(interval) for interval in service)
+        return record
+
+
+SOUNDEX_CODES = dict([(letter, '1') for letter in 'bfpv'] + [(letter, '2') for letter in 'cgjkqsxz'] +
+                     [(letter, '3') for letter in 'dt'] + [('l', '4'), ('m', '5'), ('n', '5'), ('r', '6')])
+
+
+def fold(name):
+    '''
+    Lowercases a name and strips accents and punctuation, leaving single spaced words:
+    u'Nydia M. Vel\xe1zquez' becomes 'nydia m velazquez'.
+    '''
+    if not isinstance(name, unicode):
+        name = name.decode('utf-8', 'ignore')
+    name = unicodedata.normalize('NFKD', name.lower())
+    return ' '.join(''.join(character if character.isalpha() else ' ' for character in name
+                            if not unicodedata.combining(character)).split())
+
+
+def soundex(word):
+    '''
+    American Soundex, so names that sound alike (Pelosi, Polosi) share a four character code.
+    '''
+    if not word:
+        return ''
+    code = word[0].upper()
+    previous = SOUNDEX_CODES.get(word[0], '')
+    for letter in word[1:]:
+        digit = SOUNDEX_CODES.get(letter, '')
+        if digit and digit != previous:
+            code += digit
+        if letter not in 'hw':
+            previous = digit
+    return (code + '000')[:4]
+
+
+def trigrams(name):
+    padded = '  ' + name + ' '
+    return set(padded[start:start + 3] for start in range(len(padded) - 2))
+
+
+#how fuzzy matches are ranked: this much trigram similarity, the rest the share of words that sound right
+FUZZY_TRIGRAM_WEIGHT = 0.6
+#a fuzzy match is only taken outright if it scores this well and leads the runner up by FUZZY_MARGIN
+FUZZY_MIN_SCORE = 0.6
+FUZZY_MARGIN = 0.15
+#and when nothing else matched, anyone scoring at least this is offered back to the user
+FUZZY_SUGGEST_SCORE = 0.4
+#how many resolved names getCongressId remembers before starting over
+RESOLVED_NAMES_LIMIT = 4096
+#how alike a spoken committee name has to be to a real one for CommitteeIndex.find to take it
+COMMITTEE_MIN_SCORE = 0.5
+
+
+class MemberIndex(object):
+    '''
+    Name lookup tables over current_members.json, built once each time the file is parsed
+    (or patched by update(), when refresh_data.py brings in changed members).
+    members can be any iterable of raw records, such as iter_members(); none of them is kept.
+    Every table maps a lowercased key to the positions of the matching members in file order,
+    so a lookup returns the same members, in the same order, as a scan of the list would.
+        exact:    official_full, 'first last' and 'nickname last'
+        first, last, nickname:  the single lowercased name parts
+    byId maps each bioguide ID to that member's MemberRecord.
+    For names that were misheard, lookup_fuzzy() ranks members using two more tables:
+        trigrams:  trigram of a folded name variant -> variant numbers, see variants
+        sounds:    Soundex code of any word of a member's names -> positions
+    '''
+
+    def __init__(self, members):
+        self.byId = {}
+        #(bioguide, official_full) for each member, which is what getCongressId hands back (None for leavers)
+        self.entries = []
+        self.exact = {}
+        self.first = {}
+        self.last = {}
+        self.nickname = {}
+        #(position, trigram count) for every folded name variant of every member
+        self.variants = []
+        self.trigrams = {}
+        self.sounds = {}
+        #the Soundex codes of each member's words, by position
+        self.memberSounds = []
+        #getCongressId's answer for each name it has been asked about
+        self.resolved = {}
+
+        for element in members:
+            self.index(len(self.entries), element)
+
+    @staticmethod
+    def keys(element):
+        '''
+        (exact keys, first, last, nickname) for one raw member record, as the tables are keyed.
+        '''
+        first = element['name']['first'].lower()
+        last = element['name']['last'].lower()
+        nickname = element['name'].get('nickname', '').lower()
+        exactKeys = [element['name']['official_full'].lower(), first + ' ' + last]
+        if 'nickname' in element['name']:
+            exactKeys.append(nickname + ' ' + last)
+        return (set(exactKeys), first, last, nickname)
+
+    def index(self, position, element):
+        '''
+        Adds one raw member record to every table, at position (the next one, or one unindex() emptied).
+        Positions are kept sorted in each table, so lookups still list members in file order.
+        '''
+        entry = (element['id']['bioguide'], element['name']['official_full'])
+        if position == len(self.entries):
+            self.entries.append(entry)
+            self.memberSounds.append(None)
+        else:
+            self.entries[position] = entry
+        self.byId[element['id']['bioguide']] = MemberRecord(element)
+
+        (exactKeys, first, last, nickname) = self.keys(element)
+        for table, key in ([(self.exact, key) for key in exactKeys] +
+                           [(self.first, first), (self.last, last), (self.nickname, nickname)]):
+            bisect.insort(table.setdefault(key, []), position)
+
+        codes = set()
+        for variant in set(fold(key) for key in exactKeys):
+            grams = trigrams(variant)
+            for gram in grams:
+                self.trigrams.setdefault(gram, []).append(len(self.variants))
+            self.variants.append((position, len(grams)))
+            codes.update(soundex(word) for word in variant.split())
+        for code in codes:
+            bisect.insort(self.sounds.setdefault(code, []), position)
+        self.memberSounds[position] = frozenset(codes)
+
+    def unindex(self, position, element):
+        '''
+        Takes the member at position out of every table, given the raw record they were indexed from.
+        Their entry stays (as None) until index() reuses it, so no other member's position moves.
+        '''
+        (exactKeys, first, last, nickname) = self.keys(element)
+        for table, key in ([(self.exact, key) for key in exactKeys] +
+                           [(self.first, first), (self.last, last), (self.nickname, nickname)] +
+                           [(self.sounds, code) for code in self.memberSounds[position]]):
+            table[key].remove(position)
+            if len(table[key]) == 0:
+                del table[key]
+
+        variants = set(number for number, (owner, size) in enumerate(self.variants) if owner == position)
+        #variants share grams ('robert menendez', 'bob menendez'), so each is filtered once, over all of them
+        grams = set().union(*[trigrams(variant) for variant in set(fold(key) for key in exactKeys)])
+        for gram in grams:
+            remaining = [number for number in self.trigrams[gram] if number not in variants]
+            if remaining:
+                self.trigrams[gram] = remaining
+            else:
+                del self.trigrams[gram]
+        for number in variants:
+            self.variants[number] = (None, 0)
+
+        del self.byId[self.entries[position][0]]
+        self.entries[position] = None
+        self.memberSounds[position] = frozenset()
+
+    def update(self, removed, added):
+        '''
+        Patches the tables for a refresh, touching only the members that changed.
+        removed and added map bioguide IDs to raw member records; a member whose record changed is in both,
+        and keeps their position. New members go after everyone else, and positions of members who left stay empty.
+        '''
+        positions = dict((entry[0], position) for position, entry in enumerate(self.entries) if entry is not None)
+        for ID, element in removed.items():
+            self.unindex(positions[ID], element)
+        for ID, element in sorted(added.items()):
+            self.index(positions.get(ID, len(self.entries)), element)
+        self.resolved = {}
+
+    #the tables that are already plain dicts of lists, and so go into a snapshot as they are
+    TABLES = ('exact', 'first', 'last', 'nickname', 'trigrams', 'sounds')
+
+    def dump(self):
+        '''
+        The index as plain lists and dicts, for a JSON snapshot. restore() turns it back into an index.
+        '''
+        state = dict((name, getattr(self, name)) for name in self.TABLES)
+        state['byId'] = dict((ID, record.dump()) for ID, record in self.byId.items())
+        state['entries'] = self.entries
+        state['variants'] = self.variants
+        state['memberSounds'] = [sorted(codes) for codes in self.memberSounds]
+        return state
+
+    @classmethod
+    def restore(cls, state):
+        index = cls.__new__(cls)
+        for name in cls.TABLES:
+            setattr(index, name, state[name])
+        index.byId = dict((ID, MemberRecord.restore(record)) for ID, record in state['byId'].items())
+        index.entries = [tuple(entry) if entry is not None else None for entry in state['entries']]
+        index.variants = [tuple(variant) for variant in state['variants']]
+        index.memberSounds = [frozenset(codes) for codes in state['memberSounds']]
+        index.resolved = {}
+        return index
+
+    def lookup_exact(self, name):
+        return tuple(self.entries[position] for position in self.exact.get(name, ()))
+
+    def lookup_partial(self, name, usersFirst, usersLast):
+        '''
+        Members whose first, last or nickname is the whole name, or whose first or last name
+        matches the corresponding word of it.
+        '''
+        positions = set()
+        for table, key in ((self.first, name), (self.last, name), (self.nickname, name),
+                           (self.first, usersFirst), (self.last, usersLast)):
+            positions.update(table.get(key, ()))
+        return tuple(self.entries[position] for position in sorted(positions))
+
+    def lookup_fuzzy(self, name, count=3):
+        '''
+        The count members whose names look or sound most like name, best first, as (score, entry) pairs.
+        A score mixes the trigram (Dice) similarity of the closest name variant with the share
+        of the heard words whose Soundex code matches one of the member's; 1.0 is a perfect match.
+        Only members sharing a trigram or a code with name are ever scored.
+        '''
+        name = fold(name)
+        if not name:
+            return []
+        grams = trigrams(name)
+        shared = {}
+        for gram in grams:
+            for variant in self.trigrams.get(gram, ()):
+                shared[variant] = shared.get(variant, 0) + 1
+
+        similarity = {}
+        for variant, overlap in shared.items():
+            (position, size) = self.variants[variant]
+            dice = 2.0 * overlap / (len(grams) + size)
+            if dice > similarity.get(position, 0):
+                similarity[position] = dice
+        codes = [soundex(word) for word in name.split()]
+        for code in codes:
+            for position in self.sounds.get(code, ()):
+                similarity.setdefault(position, 0)
+
+        ranked = []
+        for position, dice in similarity.items():
+            heard = sum(1 for code in codes if code in self.memberSounds[position]) / float(len(codes))
+            ranked.append((FUZZY_TRIGRAM_WEIGHT * dice + (1 - FUZZY_TRIGRAM_WEIGHT) * heard, position))
+        ranked.sort(key=lambda candidate: (-candidate[0], candidate[1]))
+        return [(score, self.entries[position]) for (score, position) in ranked[:count]]
+
+
+class CommitteeAssignment(object):
+    '''
+    One member's seat on one committee. party is the side of the committee they sit on,
+    'majority' or 'minority', and title is None for members without one.
+    '''
+    __slots__ = ('committee', 'bioguide', 'name', 'rank', 'title', 'party')
+
+    def __init__(self, committee, member):
+        self.committee = committee
+        self.bioguide = member['bioguide']
+        self.name = member['name']
+        self.rank = member['rank']
+        self.title = member.get('title')
+        self.party = member['party']
+
+
+class CommitteeIndex(object):
+    '''
+    Lookup tables over committee_members.json, built once each time the file is parsed
+    (or patched by update(), when refresh_data.py brings in changed committees),
+    from (committee, members) pairs such as iter_committees() yields.
+        byMember:     bioguide ID -> that member's assignments, in file order
+        byCommittee:  committee -> {'majority': [...], 'minority': [...]}, each sorted by rank
+        names:        lowercased committee name -> committee name as it appears in the file
+        grams:        committee name -> trigrams of its folded name, for find()
+    '''
+
+    def __init__(self, committees):
+        self.byMember = {}
+        self.byCommittee = {}
+        self.names = {}
+        self.grams = {}
+        #rank lists kept alongside each side so ranked_above can bisect instead of scanning
+        self.ranks = {}
+
+        for committee, members in committees:
+            self.index(committee, members)
+
+    def index(self, committee, members):
+        self.names[committee.lower()] = committee
+        self.grams[committee] = trigrams(fold(committee))
+        sides = self.byCommittee[committee] = {'majority': [], 'minority': []}
+        for member in members:
+            assignment = CommitteeAssignment(committee, member)
+            self.byMember.setdefault(assignment.bioguide, []).append(assignment)
+            sides.setdefault(assignment.party, []).append(assignment)
+        self.ranks[committee] = {}
+        for party, side in sides.items():
+            side.sort(key=lambda assignment: assignment.rank)
+            self.ranks[committee][party] = [assignment.rank for assignment in side]
+
+    def unindex(self, committee):
+        for side in self.byCommittee.pop(committee).values():
+            for assignment in side:
+                remaining = [other for other in self.byMember[assignment.bioguide] if other.committee != committee]
+                if remaining:
+                    self.byMember[assignment.bioguide] = remaining
+                else:
+                    del self.byMember[assignment.bioguide]
+        del self.names[committee.lower()]
+        del self.grams[committee]
+        del self.ranks[committee]
+
+    def update(self, removed, added):
+        '''
+        Patches the tables for a refresh, touching only the committees that changed.
+        removed and added map committee names to their member lists; a changed committee is in both.
+        '''
+        for committee in removed:
+            self.unindex(committee)
+        for committee in added:
+            self.index(committee, added[committee])
+
+    def dump(self):
+        '''
+        The committees in the shape of committee_members.json, for a JSON snapshot; restore() rebuilds
+        the tables from them, which is quick next to parsing and indexing the members.
+        '''
+        return dict((committee, [dict((field, getattr(assignment, field)) for field in
+                                      ('bioguide', 'name', 'rank', 'title', 'party'))
+                                 for side in sides.values() for assignment in side])
+                    for committee, sides in self.byCommittee.items())
+
+    @classmethod
+    def restore(cls, state):
+        return cls(state.iteritems())
+
+    def assignments(self, ID):
+        return self.byMember.get(ID, [])
+
+    def chair(self, committee):
+        '''
+        The majority member of rank 1, which is who holds the chair (or None if nobody does).
+        '''
+        majority = self.byCommittee[committee]['majority']
+        if len(majority) == 0 or majority[0].rank != 1:
+            return None
+        return majority[0]
+
+    def ranked_above(self, committee, rank, party='majority'):
+        '''
+        Members on one side of the committee whose rank is better (numerically lower) than rank.
+        '''
+        cutoff = bisect.bisect_left(self.ranks[committee][party], rank)
+        return self.byCommittee[committee][party][:cutoff]
+
+    def find(self, name):
+        '''
+        The committee named name, or failing that the one whose name looks most like it
+        (by trigram similarity), or None if none comes within COMMITTEE_MIN_SCORE.
+        '''
+        if name.lower() in self.names:
+            return self.names[name.lower()]
+        grams = trigrams(fold(name))
+        (bestScore, best) = (0, None)
+        for committee, committeeGrams in self.grams.items():
+            score = 2.0 * len(grams & committeeGrams) / (len(grams) + len(committeeGrams))
+            if score > bestScore or (score == bestScore and best is not None and committee < best):
+                (bestScore, best) = (score, committee)
+        return best if bestScore >= COMMITTEE_MIN_SCORE else None
+
+
+SNAPSHOT_VERSION = 8
+SNAPSHOT_SOURCES = ('current_members.json', 'committee_members.json')
+#the indexes a snapshot holds, and their classes
+SNAPSHOT_INDEXES = (('currentMembers', MemberIndex), ('committeeMembers', CommitteeIndex))
+
+
+def bundled_digests():
+    '''
+    sha1 of each JSON file deployed beside the function, by filename (missing files are left out).
+    '''
+    digests = {}
+    for filename in SNAPSHOT_SOURCES:
+        path = os.path.join(DATA_DIR, filename)
+        if os.path.exists(path):
+            with open(path, 'rb') as source:
+                digests[filename] = file_digest(source)
+    return digests
+
+
+def build_snapshot():
+    '''
+    Builds every index the handlers read straight from the JSON files, for build_snapshot.py to write out.
+        sources:  digests of the JSON the indexes were built from
+        base:     digests of the JSON deployed beside the function, so a stale snapshot can be spotted at load.
+                  Here they are the same files; refresh_data.py builds from newer ones.
+        serial:   0 here, and one more for each refresh_data.py run since
+    '''
+    with open(os.path.join(DATA_DIR, 'current_members.json'), 'rb') as source:
+        currentMembers = MemberIndex(iter_members(source))
+    with open(os.path.join(DATA_DIR, 'committee_members.json'), 'rb') as source:
+        committeeMembers = CommitteeIndex(iter_committees(source))
+    digests = bundled_digests()
+    return {
+        'version': SNAPSHOT_VERSION,
+        'sources': digests,
+        'base': digests,
+        'serial': 0,
+        'currentMembers': currentMembers,
+        'committeeMembers': committeeMembers,
+    }
+
+
+def dump_snapshot(snapshot):
+    '''
+    A snapshot as JSON. It's plain data rather than a pickle, so whoever can write the file
+    (DATA_SNAPSHOT can be on shared storage) can at worst feed the skill bad data, never run code in it.
+    '''
+    state = dict(snapshot)
+    for name, index in SNAPSHOT_INDEXES:
+        state[name] = snapshot[name].dump()
+    return json.dumps(state, separators=(',', ':'))
+
+
+def load_snapshot(source):
+    '''
+    Reads a snapshot from an open file, or returns an empty one (so every dataset falls back to its JSON)
+    if it can't be read, was written by another SNAPSHOT_VERSION, or was based on other JSON
+    than is deployed beside it. A file anyone at all may write is refused outright.
+    '''
+    if os.fstat(source.fileno()).st_mode & stat.S_IWOTH:
+        print("ignoring data snapshot, it is world writable")
+        return {}
+    try:
+        snapshot = json.load(source)
+        if snapshot.get('version') != SNAPSHOT_VERSION:
+            print("ignoring data snapshot from version {0}".format(snapshot.get('version')))
+            return {}
+        for name, index in SNAPSHOT_INDEXES:
+            snapshot[name] = index.restore(snapshot[name])
+    except (ValueError, KeyError, IndexError, TypeError, AttributeError) as error:
+        print("ignoring unreadable data snapshot: {0!r}".format(error))
+        return {}
+
+    #a redeploy with newer JSON outdates the snapshot, even one refreshed from elsewhere since
+    deployed = bundled_digests()
+    for filename, digest in snapshot['base'].items():
+        if deployed.get(filename, digest) != digest:
+            print("ignoring data snapshot, it is older than " + filename)
+            return {}
+    return snapshot
+
+
+class Dataset(object):
+    '''
+    One of the shared indexes, read from the prebuilt snapshot when there is one
+    and built from its JSON file (through source) when there isn't.
+    '''
+
+    def __init__(self, name, source):
+        self.name = name
+        self.source = source
+
+    def get(self):
+        try:
+            data = SNAPSHOT.get().get(self.name)
+        except (IOError, OSError):
+            data = None
+        if data is None:
+            data = self.source.get()
+        return data
+
+
+#DATA_SNAPSHOT can point at shared storage, for refresh_data.py to swap new data into;
+#only the refresh job should be able to write there, since whatever it holds is what the skill answers
+SNAPSHOT = DataFile(os.environ.get('DATA_SNAPSHOT', 'data_snapshot.json'), load=load_snapshot)
+CURRENT_MEMBERS = Dataset('currentMembers', DataFile('current_members.json', MemberIndex, load=iter_members))
+COMMITTEE_MEMBERS = Dataset('committeeMembers', DataFile('committee_members.json', CommitteeIndex,
+                                                         load=iter_committees))
+
+#Agreement rankings written by build_leaderboard.py. Optional, so it's only read when first asked for
+LEADERBOARD = DataFile('leaderboard.json')
+
+#Loaded at import, so the work happens in the container's init phase rather than its first request
+initStarted = time.time()
+CURRENT_MEMBERS.get()
+COMMITTEE_MEMBERS.get()
+INIT_LOAD_MS = round((time.time() - initStarted) * 1000, 2)
+
+
+# --------------- Upstream HTTP ----------------------
+
+#seconds any single upstream call may take, well inside Alexa's response deadline
+UPSTREAM_TIMEOUT = float(os.environ.get('UPSTREAM_TIMEOUT', 2.5))
+UPSTREAM_CONNECT_TIMEOUT = float(os.environ.get('UPSTREAM_CONNECT_TIMEOUT', 1.0))
+UPSTREAM_READ_TIMEOUT = float(os.environ.get('UPSTREAM_READ_TIMEOUT', UPSTREAM_TIMEOUT))
+#extra attempts after a 429, a 5xx or a dropped connection, each after a jittered backoff
+UPSTREAM_RETRIES = int(os.environ.get('UPSTREAM_RETRIES', 2))
+UPSTREAM_BACKOFF = float(os.environ.get('UPSTREAM_BACKOFF', 0.1))
+
+
+class UpstreamError(IOError):
+    '''
+    An upstream call that couldn't be completed, even after retrying. An IOError, like socket errors,
+    so callers that already handle network failures handle this too.
+    '''
+
+
+class UpstreamClient(object):
+    '''
+    A small pool of keep-alive connections to one HTTP(S) service, kept for the life of the container
+    so warm invocations skip the TCP and TLS handshakes. Thread safe: each call borrows an idle
+    connection, or opens one, and returns it to the pool afterwards.
+    Connecting and reading have separate timeouts, 429s, 5xx responses and dropped connections are
+    retried up to retries times with full jitter backoff, and gzip responses are decoded.
+    '''
+
+    def __init__(self, baseUrl, headers=None, connectTimeout=UPSTREAM_CONNECT_TIMEOUT,
+                 readTimeout=UPSTREAM_READ_TIMEOUT, retries=UPSTREAM_RETRIES, maxIdle=8):
+        parsed = urlparse.urlsplit(baseUrl)
+        self.secure = parsed.scheme == 'https'
+        self.host = parsed.hostname
+        self.port = parsed.port or (443 if self.secure else 80)
+        self.basePath = parsed.path.rstrip('/')
+        self.headers = dict(headers or {}, **{'Accept-Encoding': 'gzip', 'Connection': 'keep-alive'})
+        self.connectTimeout = connectTimeout
+        self.readTimeout = readTimeout
+        self.retries = retries
+        self.maxIdle = maxIdle
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            if self.idle:
+                return self.idle.pop()
+        if self.secure:
+            connection = httplib.HTTPSConnection(self.host, self.port, timeout=self.connectTimeout)
+        else:
+            connection = httplib.HTTPConnection(self.host, self.port, timeout=self.connectTimeout)
+        connection.connect()
+        connection.sock.settimeout(self.readTimeout)
+        return connection
+
+    def release(self, connection):
+        with self.lock:
+            if len(self.idle) < self.maxIdle:
+                self.idle.append(connection)
+                return
+        connection.close()
+
+    def close(self):
+        #the pool stays usable, it just opens new connections
+        with self.lock:
+            (idle, self.idle) = (self.idle, [])
+        for connection in idle:
+            connection.close()
+
+    def backoff(self, attempt, retryAfter=None):
+        delay = random.uniform(0, UPSTREAM_BACKOFF * (2 ** attempt))
+        if retryAfter is not None and retryAfter.isdigit():
+            delay = max(delay, min(float(retryAfter), UPSTREAM_BACKOFF * (2 ** self.retries)))
+        timing().count('upstreamRetry')
+        time.sleep(delay)
+
+    def get_json(self, path):
+        '''
+        GETs basePath + path and returns the decoded JSON body.
+        Raises UpstreamError once every attempt has failed, or straight away on any other non-200.
+        '''
+        for attempt in range(self.retries + 1):
+            lastAttempt = attempt == self.retries
+            try:
+                connection = self.acquire()
+            except (socket.error, httplib.HTTPException) as error:
+                if lastAttempt:
+                    raise UpstreamError("couldn't connect to {0}: {1!r}".format(self.host, error))
+                self.backoff(attempt)
+                continue
+
+            try:
+                connection.request('GET', self.basePath + path, headers=self.headers)
+                response = connection.getresponse()
+                body = response.read()
+            except (socket.error, httplib.HTTPException) as error:
+                #most often a pooled connection the server has since closed
+                connection.close()
+                if lastAttempt:
+                    raise UpstreamError("request to {0} failed: {1!r}".format(self.host, error))
+                self.backoff(attempt)
+                continue
+
+            if response.will_close:
+                connection.close()
+            else:
+                self.release(connection)
+
+            if response.status == 429 or response.status >= 500:
+                if lastAttempt:
+                    raise UpstreamError("{0} answered {1} {2}".format(self.host, response.status, response.reason))
+                self.backoff(attempt, response.getheader('retry-after'))
+                continue
+            if response.status != 200:
+                raise UpstreamError("{0} answered {1} {2}".format(self.host, response.status, response.reason))
+
+            if response.getheader('content-encoding', '').lower() == 'gzip':
+                body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+            return json.loads(body)
+
+
+# --------------- Vote comparisons from ProPublica ----------------------
+
+PROPUBLICA_BASE_URL = os.environ.get('PROPUBLICA_BASE_URL', "https://api.propublica.org/congress/v1")
+PROPUBLICA_PATH = "/members/{0}/votes/{1}/{2}/{3}.json"
+PROPUBLICA_KEY = "DIl7ejWZz5ajxyzYyOjDN89YLp1xekEb1mjWkjq1"
+#the oldest congress ProPublica has vote comparisons for, in each house
+PROPUBLICA_FIRST_CONGRESS = {'house': 102, 'senate': 101}
+#most requests one question makes to ProPublica at once, so a long shared career doesn't set off its rate limit
+UPSTREAM_CONCURRENCY = int(os.environ.get('UPSTREAM_CONCURRENCY', 4))
+
+
+def propublica_client(baseUrl=PROPUBLICA_BASE_URL):
+    return UpstreamClient(baseUrl, headers={"X-API-Key" : PROPUBLICA_KEY})
+
+
+PROPUBLICA = propublica_client()
+
+
+class VoteCache(object):
+    '''
+    Caches (common_votes, disagree_votes) per comparison, keyed by comparison_key().
+    The first tier is an in-memory LRU that lives as long as the container. If directory is set,
+    entries are also written there as small JSON files, so they outlive the container's memory.
+    Closed congresses can't gain votes and never expire; the current congress expires after ttl seconds.
+    '''
+
+    def __init__(self, size, directory, ttl):
+        self.size = size
+        self.directory = directory
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def path(self, key):
+        return os.path.join(self.directory, '{0}-{1}-{2}-{3}.json'.format(*key))
+
+    def fresh(self, key, fetched):
+        return key[2] < current_congress() or time.time() - fetched < self.ttl
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                (value, fetched) = self.entries.pop(key)
+                if self.fresh(key, fetched):
+                    self.entries[key] = (value, fetched)
+                    return value
+
+        if not self.directory:
+            return None
+        try:
+            with open(self.path(key)) as data:
+                entry = json.load(data)
+        except (IOError, ValueError):
+            return None
+        if not self.fresh(key, entry['fetched']):
+            return None
+        value = tuple(entry['value'])
+        self.remember(key, value, entry['fetched'])
+        return value
+
+    def put(self, key, value):
+        fetched = time.time()
+        self.remember(key, value, fetched)
+        if not self.directory:
+            return
+        try:
+            write_atomically(self.path(key), lambda data: json.dump({'value': value, 'fetched': fetched}, data))
+        except (IOError, OSError):
+            pass
+
+    def remember(self, key, value, fetched):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (value, fetched)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+
+VOTE_CACHE = VoteCache(int(os.environ.get('VOTE_CACHE_SIZE', 1024)),
+                       os.environ.get('VOTE_CACHE_DIR', '/tmp/vote_cache'),
+                       int(os.environ.get('VOTE_CACHE_TTL', 6 * 60 * 60)))
+
+
+def comparison_key(ID1, ID2, congress, house):
+    '''
+    Comparisons are symmetric, so A against B and B against A share a key.
+    '''
+    (first, second) = sorted((ID1, ID2))
+    return (first, second, congress, house)
+
+
+def comparison_name(ID1, ID2, congress, house):
+    '''
+    comparison_key() as a string, for places that need one, like sessionAttributes.
+    '''
+    return '{0}-{1}-{2}-{3}'.format(*comparison_key(ID1, ID2, congress, house))
+
+
+def fetch_vote_comparison(ID1, ID2, congress, house):
+    '''
+    Returns (common_votes, disagree_votes) for two members in one congress and house,
+    answering from VOTE_CACHE when it can.
+    '''
+    key = comparison_key(ID1, ID2, congress, house)
+    cached = VOTE_CACHE.get(key)
+    if cached is not None:
+        timing().count('voteCacheHit')
+        return cached
+    timing().count('voteCacheMiss')
+
+    with timing().phase('upstream {0} {1}'.format(congress, house)):
+        votes = PROPUBLICA.get_json(PROPUBLICA_PATH.format(ID1, ID2, congress, house))
+
+    result = (votes['results'][0]['common_votes'], votes['results'][0]['disagree_votes'])
+    VOTE_CACHE.put(key, result)
+    return result
+
+
+def fetch_vote_comparisons(ID1, ID2, sessions, timeout=UPSTREAM_TIMEOUT, remembered=None):
+    '''
+    Runs fetch_vote_comparison for every (congress, house) in sessions, newest congress first,
+    on up to UPSTREAM_CONCURRENCY threads. Returns whichever results came back within timeout,
+    in the order of sessions. Fetches that fail or run late are logged and left out, so the caller
+    can answer with the rest, as are congresses older than ProPublica's data.
+    With VOTE_SOURCE set to 'local', sessions that have a roll-call matrix are answered from it
+    and only the rest go upstream.
+    remembered, if given, maps comparison_name() to results the caller already has; those sessions
+    aren't fetched, and every fresh result is added to it.
+    '''
+    if remembered is None:
+        remembered = {}
+    results = [remembered.get(comparison_name(ID1, ID2, congress, house)) for (congress, house) in sessions]
+    if VOTE_SOURCE == 'local':
+        for position, (congress, house) in enumerate(sessions):
+            matrix = load_vote_matrix(congress, house)
+            if results[position] is None and matrix is not None:
+                results[position] = matrix.compare(ID1, ID2)
+                timing().count('voteMatrixHit')
+
+    wanted = [position for position, (congress, house) in enumerate(sessions)
+              if results[position] is None and congress >= PROPUBLICA_FIRST_CONGRESS[house]]
+    pending = Queue.Queue()
+    for position in sorted(wanted, key=lambda position: -sessions[position][0]):
+        pending.put(position)
+    failed = set()
+    requestTiming = timing()
+    deadline = time.time() + timeout
+
+    def worker():
+        TIMING.current = requestTiming
+        #once the deadline passes nobody is waiting on the answers, so nothing more is started
+        while time.time() < deadline:
+            try:
+                position = pending.get_nowait()
+            except Queue.Empty:
+                return
+            (congress, house) = sessions[position]
+            try:
+                results[position] = fetch_vote_comparison(ID1, ID2, congress, house)
+            except (IOError, ValueError, KeyError, IndexError) as error:
+                failed.add(position)
+                print("vote comparison failed for {0}/{1} in {2} {3}: {4!r}".format(ID1, ID2, congress, house, error))
+
+    threads = []
+    for number in range(min(UPSTREAM_CONCURRENCY, len(wanted))):
+        thread = threading.Thread(target=worker)
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join(max(0, deadline - time.time()))
+
+    results = list(results)
+    late = [sessions[position] for position in wanted if results[position] is None and position not in failed]
+    if late:
+        print("vote comparisons for {0}/{1} ran past {2}s: {3}".format(
+            ID1, ID2, timeout, ', '.join('{0} {1}'.format(congress, house) for (congress, house) in late)))
+    for position, (congress, house) in enumerate(sessions):
+        if results[position] is not None:
+            remembered[comparison_name(ID1, ID2, congress, house)] = results[position]
+    return [result for result in results if result is not None]
+
+
+# --------------- Vote comparisons from local roll-call data ----------------------
+
+#'propublica' asks the API for every comparison, 'local' answers from VOTE_MATRIX_DIR where it can
+VOTE_SOURCE = os.environ.get('VOTE_SOURCE', 'propublica')
+VOTE_MATRIX_DIR = os.environ.get('VOTE_MATRIX_DIR', os.path.join(DATA_DIR, 'votes'))
+
+
+class VoteMatrix(object):
+    '''
+    Every roll call of one congress and house as a members x votes int8 array:
+    1 for yea, -1 for nay and 0 for anything else (not voting, present, not yet seated).
+    Files come in pairs under VOTE_MATRIX_DIR, written by build_vote_matrix.py:
+        {congress}-{house}.npy   the array, memory-mapped rather than read
+        {congress}-{house}.json  the bioguide ID of each row, in order
+    '''
+
+    def __init__(self, votes, members):
+        self.votes = votes
+        self.members = members
+        self.rows = dict((ID, row) for row, ID in enumerate(members))
+        self.common = None
+        self.disagree = None
+        self.lock = threading.Lock()
+
+    def compare(self, ID1, ID2):
+        '''
+        (common_votes, disagree_votes) for two members, or None if either isn't in this matrix.
+        '''
+        if ID1 not in self.rows or ID2 not in self.rows:
+            return None
+        first = self.votes[self.rows[ID1]]
+        second = self.votes[self.rows[ID2]]
+        both = (first != 0) & (second != 0)
+        return (int(both.sum()), int((both & (first != second)).sum()))
+
+    def agreement(self):
+        '''
+        (common_votes, disagree_votes) for every pair of members at once, as two members x members arrays.
+        Where both voted, the product of two rows is 1 on agreement and -1 on disagreement,
+        so disagreements are half of (common - net). Computed on first use and kept.
+        '''
+        with self.lock:
+            if self.common is None:
+                present = (self.votes != 0).astype(numpy.int32)
+                signed = numpy.asarray(self.votes, dtype=numpy.int32)
+                self.common = present.dot(present.T)
+                self.disagree = (self.common - signed.dot(signed.T)) // 2
+        return (self.common, self.disagree)
+
+    def most_aligned(self, ID, count=5):
+        '''
+        The count members who agree with ID most often, as (bioguide, common_votes, disagree_votes),
+        best first. Members who never voted alongside ID are left out.
+        '''
+        if ID not in self.rows:
+            return []
+        (common, disagree) = self.agreement()
+        row = self.rows[ID]
+        shared = common[row].astype(numpy.float64)
+        shared[row] = 0
+        rates = numpy.where(shared > 0, (shared - disagree[row]) / numpy.maximum(shared, 1), -1)
+        ranked = numpy.argsort(-rates, kind='mergesort')[:count]
+        return [(self.members[other], int(common[row][other]), int(disagree[row][other]))
+                for other in ranked if rates[other] >= 0]
+
+
+VOTE_MATRICES = {}
+VOTE_MATRICES_LOCK = threading.Lock()
+
+
+def load_vote_matrix(congress, house):
+    '''
+    The VoteMatrix for one congress and house, loaded once per container.
+    None if numpy isn't installed or no matrix was built for that session.
+    '''
+    key = (congress, house)
+    with VOTE_MATRICES_LOCK:
+        if key not in VOTE_MATRICES:
+            VOTE_MATRICES[key] = None
+            base = os.path.join(VOTE_MATRIX_DIR, '{0}-{1}'.format(congress, house))
+            if numpy is not None and os.path.exists(base + '.npy'):
+                with open(base + '.json') as data:
+                    members = json.load(data)
+                VOTE_MATRICES[key] = VoteMatrix(numpy.load(base + '.npy', mmap_mode='r'), members)
+        return VOTE_MATRICES[key]
+
+
+def votes_recorded(congress, house):
+    '''
+    Whether any source has the votes of congress in house: ProPublica, or with VOTE_SOURCE 'local', a matrix.
+    '''
+    return congress >= PROPUBLICA_FIRST_CONGRESS[house] or \
+        (VOTE_SOURCE == 'local' and load_vote_matrix(congress, house) is not None)
 
 
 # --------------- Helpers that build all of the responses ----------------------
@@ -92,6 +1298,98 @@ def handle_session_end_request():
     return build_response({}, build_speechlet_response(
         card_title, speech_output, None, should_end_session))
 
+
+#answers leave the session open for follow ups, so this is what Alexa asks if the user goes quiet;
+#a "no" to it ends the session, and a "yes" asks what they'd like to know
+FOLLOW_UP_REPROMPT = "Is there anything else you'd like to know?"
+
+
+def get_follow_up_response(session):
+    card_title = "Follow Up"
+    speech_output = "What would you like to know? You can ask about a member of congress, " \
+                    "how two of them vote, or who sits on a committee."
+    should_end_session = False
+    return build_response(session_state(session), build_speechlet_response(
+        card_title, speech_output, speech_output, should_end_session))
+
+
+def get_fallback_response(session):
+    card_title = "Not Understood"
+    speech_output = "I'm sorry, I didn't understand that. You can ask about a member of congress, " \
+                    "how two of them vote, or who sits on a committee, or say stop."
+    should_end_session = False
+    return build_response(session_state(session), build_speechlet_response(
+        card_title, speech_output, speech_output, should_end_session))
+#how many resolved names and fetched comparisons a session carries from turn to turn
+SESSION_RESOLVED_LIMIT = 10
+SESSION_COMPARISONS_LIMIT = 20
+
+
+def session_state(session):
+    '''
+    A copy of what earlier turns of this conversation left in sessionAttributes, for this turn to build on.
+    It can hold:
+        member:      bioguide ID of the member last talked about, for 'what about her committees?'
+        resolved:    [[resolved_key(), bioguide ID], ...] names already resolved this session, newest last
+        candidates:  [[bioguide ID, official name], ...] offered by the last disambiguation
+        pending:     the intent that disambiguation interrupted, and the slot it was resolving
+        comparisons: [[comparison key, common votes, disagree votes], ...] fetched this session, newest last
+    '''
+    return dict((session or {}).get('attributes') or {})
+
+
+def remember(session_attributes, name, entry, limit):
+    '''
+    Adds entry to the front-trimmed list session_attributes[name], replacing any entry with the same key.
+    '''
+    entries = [old for old in session_attributes.get(name, []) if old[0] != entry[0]]
+    session_attributes[name] = (entries + [entry])[-limit:]
+
+
+def resolved_key(intent, heard):
+    '''
+    What a resolved name is remembered under in the session: the name, and the state asked about if any
+    ('ryan|ohio'), since a state slot can pick someone else than the name alone did.
+    '''
+    state = intent.get('slots', {}).get('state', {}).get('value')
+    return heard.lower() + u'|' + state.lower() if state else heard.lower()
+
+
+def remembered_member(session, currentMembers):
+    ID = session_state(session).get('member')
+    return ID if ID in currentMembers.byId else None
+
+
+def resolve_member(intent, slot, session_attributes, currentMembers, lastMember=None):
+    '''
+    getCongressId for one slot, in the context of the conversation so far. An empty slot means the
+    member last talked about (lastMember if given, since resolving other slots moves it on), and a name
+    resolved (or disambiguated) earlier in the session isn't looked up again.
+    Returns (ID, name to say, reprompt_text) like getCongressId, and records the outcome in session_attributes.
+    '''
+    heard = intent.get('slots', {}).get(slot, {}).get('value')
+    if heard is None:
+        ID = lastMember or session_attributes['member']
+        return (ID, currentMembers.byId[ID].name, None)
+
+    key = resolved_key(intent, heard)
+    resolved = dict(session_attributes.get('resolved', []))
+    if resolved.get(key) in currentMembers.byId:
+        (ID, reprompt_text) = (resolved[key], None)
+    else:
+        with timing().phase('resolve'):
+            (ID, reprompt_text) = getCongressId(intent, heard, currentMembers)
+
+    if reprompt_text is None:
+        remember(session_attributes, 'resolved', [key, ID], SESSION_RESOLVED_LIMIT)
+        session_attributes['member'] = ID
+        session_attributes.pop('candidates', None)
+        session_attributes.pop('pending', None)
+    elif len(ID) != 0:
+        session_attributes['candidates'] = [list(candidate) for candidate in ID]
+        session_attributes['pending'] = {'intent': intent, 'slot': slot}
+    return (ID, heard, reprompt_text)
+
  
 def getCongressId(intent, name, currentMembers):
     '''
@@ -99,75 +1397,84 @@ def getCongressId(intent, name, currentMembers):
     If only one valid response is found, it returns just the ID.
     If more than are found, it returns a tuple of tuples, each containing an id:name pair. 
     Also always returns reprompt text, which is simply None if no issues were found.
+    If the intent has a state slot, a name shared by several members resolves to the one from that state.
+    Answers are remembered on currentMembers, so a name that comes up again (or several times
+    in one batch) is only looked up once per loaded index.
+    '''
+    key = (name.lower(), intent.get('slots', {}).get('state', {}).get('value', '').lower())
+    if key not in currentMembers.resolved:
+        if len(currentMembers.resolved) >= RESOLVED_NAMES_LIMIT:
+            currentMembers.resolved.clear()
+        currentMembers.resolved[key] = lookup_congress_id(intent, name, currentMembers)
+    return currentMembers.resolved[key]
+
+
+def lookup_congress_id(intent, name, currentMembers):
+    '''
+    Does the work for getCongressId, which returns the same thing.
     '''
 
-    validResponses = ()
     reprompt_text = None
 
     name = name.lower()
     #This checks current members for the name, checking both full names and just first + last.
-    #Should be decently fast, on personal clock double checking didn't effect speed over 50ms
-    for element in currentMembers:
-        first = element['name']['first'].lower()
-        last = element['name']['last'].lower()
-        full = element['name']['official_full'].lower()
-        if 'nickname' in element['name']:
-            nickname = element['name']['nickname'].lower()
-            booleanMatch = (full == name or first + ' ' + last == name or nickname + ' ' + last == name)
-        else:
-            booleanMatch = (full == name or first + ' ' + last == name)
-
-        if booleanMatch:
-            validResponses += ((element['id']['bioguide'], element['name']['official_full']),)
+    #Both passes are single dict hits against the tables MemberIndex builds at load time.
+    validResponses = currentMembers.lookup_exact(name)
 
-    
     #This searches all congressman with a vaguely similar name, if no real matches were found.
     if (len(validResponses) == 0):
         usersFirst = name.split(' ')[0]
         usersLast = name.split(' ')[-1]
-
-
-        for element in currentMembers:
-            first = element['name']['first'].lower()
-            last = element['name']['last'].lower()
-            if 'nickname' in element['name']:
-                nickname = element['name']['nickname'].lower()
-            else:
-                nickname = ''
-            booleanMatch = (first == name or last == name or nickname == name
-                            or first == usersFirst or last == usersLast)
-
-            if booleanMatch:
-                validResponses += ((element['id']['bioguide'], element['name']['official_full']),)
+        validResponses = currentMembers.lookup_partial(name, usersFirst, usersLast)
 
         #if only one response was found, it returns that result.
         if (len(validResponses) == 1):
             return (validResponses[0][0], reprompt_text)
-        #if none were found, it passes a simple error (what else could be done?)
+
+        #Speech recognition often hands over near misses ('polosi'), so before listing everyone sharing a
+        #first or last name, or giving up, this checks whether a single member clearly sounds like what was heard.
+        #If others did match, the winner has to be one of them, and nobody else can have the very last name heard
+        #('tom price' is David Price or one of the Toms, not Tom Rice)
+        suggestions = currentMembers.lookup_fuzzy(name)
+        if len(suggestions) != 0 and suggestions[0][0] >= FUZZY_MIN_SCORE and \
+                (len(suggestions) == 1 or suggestions[0][0] - suggestions[1][0] >= FUZZY_MARGIN):
+            winner = suggestions[0][1]
+            sameLast = set(currentMembers.entries[position] for position in currentMembers.last.get(usersLast, ()))
+            if len(validResponses) == 0 or (winner in validResponses and len(sameLast - set([winner])) == 0):
+                return (winner[0], reprompt_text)
+
+        #if none were found, it passes a simple error, offering whichever names came closest
         if (len(validResponses) == 0):
-            reprompt_text = "Sorry, I couldn't recognize the name " + name + ". " \
-                            "I work best with both the first and last names of someone serving in the current congress. " \
-                            "Please try stating your request again."
+            suggestedNames = u""
+            for (score, element) in suggestions:
+                if score >= FUZZY_SUGGEST_SCORE:
+                    (state, party) = getBasicDetails(('state', 'party'), element[0], currentMembers)
+                    suggestedNames += u"{0}, the {1} from {2}, or ".format(element[1], party, state)
+            reprompt_text = u"Sorry, I couldn't recognize the name " + name + u". "
+            if suggestedNames != u"":
+                reprompt_text += u"Did you mean " + suggestedNames[0:-5] + u"? "
+            reprompt_text += u"I work best with both the first and last names of someone serving in the current congress. " \
+                             u"Please try stating your request again."
             return (validResponses, reprompt_text)
         #and if many were found, it continues to the next block
             
 
     #This block is built to activate if the initital search turned up more than one, OR if the second less formal search did
     if (len(validResponses) > 1):
-        concatenatedNames = ""
+        concatenatedNames = u""
         for element in validResponses:
             (state, party) = getBasicDetails(('state', 'party'), element[0], currentMembers)
 
-            #This simple if block with check if the user has already specified what state and party the legislator belongs to
-            if 'state' in intent['slots']:
-                if 'state' == intent['slots']['state']:
-                    return (cantidate[0], None)
+            #This simple if block with check if the user has already specified what state the legislator belongs to
+            if 'value' in intent.get('slots', {}).get('state', {}):
+                if state.lower() == intent['slots']['state']['value'].lower():
+                    return (element[0], None)
 
             #Else, this statement when looped creates a meaningful response to clarify.     
-            concatenatedNames += "{0}, the {1} from {2}, or ".format(element[1], party, state)
+            concatenatedNames += u"{0}, the {1} from {2}, or ".format(element[1], party, state)
 
-        reprompt_text = "It looks like there's multiple legistlators with the same name. " \
-                "Please ask again, specifying either " + concatenatedNames[0:-5] + "."
+        reprompt_text = u"It looks like there's multiple legistlators with the same name. " \
+                u"Please ask again, specifying either " + concatenatedNames[0:-5] + u"."
     else:
         validResponses = validResponses[0][0]
 
@@ -183,39 +1490,26 @@ def getBasicDetails(desiredResults, ID, currentMembers):
     '''
     
     results = ()
-    profile = ""
-    
-    for element in currentMembers:
-        if element['id']['bioguide'] == ID:
-            profile = element
-            break
-        
+    profile = currentMembers.byId[ID]
 
     if 'name' in desiredResults:
-        results += (profile['name']['first'] + ' ' + profile['name']['last'],)
+        results += (profile.name,)
 
     #finds the year when they were first elected to the house
     if 'elected' in desiredResults:
-        results += (profile['terms'][0]['start'][0:4],)
+        results += (profile.elected,)
 
     #gives the two digit state code. 
     if 'state' in desiredResults:
-        results += (profile['terms'][-1]['state'],)
+        results += (profile.state,)
 
     #finds the party the legislator was most recently part of
     if 'party' in desiredResults:
-        results += (profile['terms'][-1]['party'],)
+        results += (profile.party,)
 
     #finds the house of congress they have served in. Either 'house', 'senate', or 'both houses of congress'
     if 'house' in desiredResults:
-        houseCount = [0, 0]
-        for term in profile['terms']:
-            if term['type'] == 'rep':
-                houseCount[0] += 1
-            elif term['type'] == 'sen':
-                houseCount[1] += 1
-        houseCount = (str(houseCount[0]), str(houseCount[1]))
-        results += (houseCount,)
+        results += (profile.house,)
 
     return results
 
@@ -226,12 +1520,11 @@ def general_record_check(intent, session, currentMembers):
     Returns a response properly formatted to work with Alexa. 
     '''
     card_title = "General Record Info"
-    session_attributes = {}
-    should_end_session = True
+    session_attributes = session_state(session)
+    should_end_session = False
     speech_output = ""
     
-    congressmanName = (intent['slots']['congressman']['value'])
-    (ID, reprompt_text) = getCongressId(intent, congressmanName, currentMembers)
+    (ID, congressmanName, reprompt_text) = resolve_member(intent, 'congressman', session_attributes, currentMembers)
 
 
     #This checks whether an individual congressman was found before continuing
@@ -243,13 +1536,13 @@ def general_record_check(intent, session, currentMembers):
     #And upon continuing, it gets all the basic details of the congressman and creates a sentence
     (congressmanName, electedDate, state, party, house) =  getBasicDetails(('name', 'elected',
         'state', 'party', 'house'), ID, currentMembers)
-    speech_output = "{0} is a {1} hailing from {2}, first elected to congress in {3}. " \
-            "They have served {4} terms in the house, and {5} terms in the senate.".format(
+    speech_output = u"{0} is a {1} hailing from {2}, first elected to congress in {3}. " \
+            u"They have served {4} terms in the house, and {5} terms in the senate.".format(
                     congressmanName, party, state, electedDate, house[0], house[1])
                 
 
     return build_response(session_attributes, build_speechlet_response(
-        card_title, speech_output, reprompt_text, should_end_session))
+        card_title, speech_output, FOLLOW_UP_REPROMPT, should_end_session))
 
 def individual_committee_check(intent, session, currentMembers):
     '''
@@ -257,13 +1550,12 @@ def individual_committee_check(intent, session, currentMembers):
     Returns a response properly formatted to work with Alexa. 
     '''
     card_title = "Individual Committee Info"
-    session_attributes = {}
-    should_end_session = True
+    session_attributes = session_state(session)
+    should_end_session = False
     speech_output = ""
 
     
-    congressmanName = (intent['slots']['congressman']['value'])
-    (ID, reprompt_text) = getCongressId(intent, congressmanName, currentMembers)
+    (ID, congressmanName, reprompt_text) = resolve_member(intent, 'congressman', session_attributes, currentMembers)
 
 
     if reprompt_text != None:
@@ -272,26 +1564,151 @@ def individual_committee_check(intent, session, currentMembers):
 
 
     committeeAssignments = {}
-    with open('committee_members.json') as data:
-        jsonData = json.load(data)
-
-    for committee in jsonData:
-        for member in jsonData[committee]:
-            if member['bioguide'] == ID:
-                committeeAssignments[committee] = member['rank']
+    with timing().phase('load'):
+        committeeMembers = COMMITTEE_MEMBERS.get()
+    with timing().phase('committees'):
+        for assignment in committeeMembers.assignments(ID):
+            committeeAssignments[assignment.committee] = assignment.rank
 
     speech_output = congressmanName + ' holds the chair of rank '
     count = 0
     for assignment in committeeAssignments:
         if count == (len(committeeAssignments) - 1) and len(committeeAssignments) != 1:
-            speech_output += 'and {0} in the {1}.'.format(committeeAssignments[assignment], assignment) 
+            speech_output += u'and {0} in the {1}.'.format(committeeAssignments[assignment], assignment) 
         else:
-            speech_output += '{0} in the {1}, '.format(committeeAssignments[assignment], assignment)
+            speech_output += u'{0} in the {1}, '.format(committeeAssignments[assignment], assignment)
         count = count + 1
 
 
     return build_response(session_attributes, build_speechlet_response(
-        card_title, speech_output, reprompt_text, should_end_session))
+        card_title, speech_output, FOLLOW_UP_REPROMPT, should_end_session))
+
+def most_aligned_check(intent, session, currentMembers):
+    '''
+    This function handles the intent asking who a congressman votes with most often.
+    It answers straight from the leaderboard build_leaderboard.py precomputes.
+    Returns a response properly formatted to work with Alexa. 
+    '''
+    card_title = "Voting Allies"
+    session_attributes = session_state(session)
+    should_end_session = False
+
+    (ID, congressmanName, reprompt_text) = resolve_member(intent, 'congressman', session_attributes, currentMembers)
+
+    if reprompt_text != None:
+        return build_response(session_attributes, build_speechlet_response(
+        card_title, reprompt_text, reprompt_text, False))
+
+    try:
+        with timing().phase('load'):
+            leaderboard = LEADERBOARD.get()
+        #the leaderboard can be older than the member data, so anyone who has since left is passed over
+        partners = [partner for partner in leaderboard['members'].get(ID, []) if partner[0] in currentMembers.byId]
+    except (IOError, OSError):
+        partners = None
+
+    if partners is None:
+        speech_output = 'I\'m sorry, I don\'t have voting rankings ready yet. Please try again later.'
+    elif len(partners) == 0:
+        speech_output = u'I haven\'t seen {0} share enough votes with anyone to say who they agree with most.'.format(
+                congressmanName)
+    else:
+        allies = [u"{0} at {1} percent".format(currentMembers.byId[partner].name, percentage)
+                  for (partner, percentage, commonVotes) in partners[0:3]]
+        if len(allies) > 1:
+            allies[-1] = u'and ' + allies[-1]
+        #without roll-call matrices, only members sharing a committee were ever compared
+        if leaderboard.get('committeeOnly'):
+            speech_output = u'Of the members who share a committee with {0}, they vote most often with {1}.'.format(
+                    congressmanName, ', '.join(allies))
+        else:
+            speech_output = u'{0} votes most often with {1}.'.format(congressmanName, ', '.join(allies))
+
+    return build_response(session_attributes, build_speechlet_response(
+        card_title, speech_output, FOLLOW_UP_REPROMPT, should_end_session))
+
+def committee_alignment_check(intent, session, currentMembers):
+    '''
+    This function handles the intent asking how often the members of one committee vote together.
+    It answers straight from the leaderboard build_leaderboard.py precomputes.
+    Returns a response properly formatted to work with Alexa. 
+    '''
+    card_title = "Committee Alignment"
+    session_attributes = session_state(session)
+    should_end_session = False
+
+    committee = COMMITTEE_MEMBERS.get().find(intent['slots']['committee']['value'])
+    if committee is None:
+        reprompt_text = "Sorry, I couldn't find a committee called " + intent['slots']['committee']['value'] + ". " \
+                        "Please try again with the committee's full name."
+        return build_response(session_attributes, build_speechlet_response(
+        card_title, reprompt_text, reprompt_text, False))
+
+    try:
+        with timing().phase('load'):
+            alignment = LEADERBOARD.get()['committees'].get(committee)
+        ready = True
+    except (IOError, OSError):
+        ready = False
+
+    if not ready:
+        speech_output = 'I\'m sorry, I don\'t have voting rankings ready yet. Please try again later.'
+    elif alignment is None:
+        speech_output = u'I haven\'t seen the members of the {0} share enough votes to say.'.format(committee)
+    else:
+        (closest1, closest2, closestPercentage) = alignment['closest']
+        (furthest1, furthest2, furthestPercentage) = alignment['furthest']
+        speech_output = u'Members of the {0} agree on {1} percent of the votes they share.'.format(
+                committee, alignment['agreement'])
+        #the pairs are only named while all four members are still in the member data
+        if all(ID in currentMembers.byId for ID in (closest1, closest2, furthest1, furthest2)):
+            speech_output += u' The closest pair is {0} and {1}, at {2} percent, and the furthest apart are ' \
+                    u'{3} and {4}, at {5} percent.'.format(
+                    currentMembers.byId[closest1].name, currentMembers.byId[closest2].name, closestPercentage,
+                    currentMembers.byId[furthest1].name, currentMembers.byId[furthest2].name, furthestPercentage)
+
+    return build_response(session_attributes, build_speechlet_response(
+        card_title, speech_output, FOLLOW_UP_REPROMPT, should_end_session))
+
+def choose_candidate(intent, session, currentMembers):
+    '''
+    This function handles the answer to a disambiguation, like 'the one from Ohio'. It picks from the
+    candidates the last turn offered, then answers the question that the disambiguation interrupted.
+    Returns a response properly formatted to work with Alexa. 
+    '''
+    card_title = "Which Legislator"
+    session_attributes = session_state(session)
+    candidates = session_attributes.get('candidates')
+    pending = session_attributes.get('pending')
+
+    if not candidates or not pending:
+        reprompt_text = "I'm not sure who you're asking about. Please ask your question again, with their full name."
+        return build_response(session_attributes, build_speechlet_response(
+        card_title, reprompt_text, reprompt_text, False))
+
+    state = intent['slots']['state']['value'].lower()
+    candidates = [candidate for candidate in candidates if candidate[0] in currentMembers.byId]
+    matching = [candidate for candidate in candidates if currentMembers.byId[candidate[0]].state.lower() == state]
+
+    #if that still leaves several (or none), it narrows the list down as far as it can and asks again
+    if len(matching) != 1:
+        if len(matching) > 1:
+            session_attributes['candidates'] = candidates = matching
+        concatenatedNames = u""
+        for (ID, name) in candidates:
+            (state, party) = getBasicDetails(('state', 'party'), ID, currentMembers)
+            concatenatedNames += u"{0}, the {1} from {2}, or ".format(name, party, state)
+        reprompt_text = u"Sorry, I still can't tell who you mean. Please say either " + concatenatedNames[0:-5] + u"."
+        return build_response(session_attributes, build_speechlet_response(
+        card_title, reprompt_text, reprompt_text, False))
+
+    heard = pending['intent']['slots'][pending['slot']]['value']
+    remember(session_attributes, 'resolved', [resolved_key(pending['intent'], heard), matching[0][0]],
+             SESSION_RESOLVED_LIMIT)
+    session_attributes.pop('candidates')
+    session_attributes.pop('pending')
+    return on_intent({'requestId': 'chooseCandidate', 'intent': pending['intent']},
+                     dict(session, attributes=session_attributes))
 
 def record_compare(intent, session, currentMembers):
     '''
@@ -299,15 +1716,17 @@ def record_compare(intent, session, currentMembers):
     Returns a response properly formatted to work with Alexa. 
     '''
     card_title = "Comparison"
-    session_attributes = {}
-    should_end_session = True
+    session_attributes = session_state(session)
+    should_end_session = False
     speech_output = 'I\'m sorry, I couldn\'t find one of those congressman in my records'
 
-    congressmanName1 = (intent['slots']['congressmanOne']['value'])
-    congressmanName2 = (intent['slots']['congressmanTwo']['value'])
-
-    (ID1, reprompt_text1) = getCongressId(intent, congressmanName1, currentMembers)
-    (ID2, reprompt_text2) = getCongressId(intent, congressmanName2, currentMembers)
+    #either name can be left out to mean whoever the conversation was last about ('compare her to Paul Ryan')
+    lastMember = session_attributes.get('member')
+    (ID1, congressmanName1, reprompt_text1) = resolve_member(intent, 'congressmanOne', session_attributes,
+                                                             currentMembers, lastMember)
+    if reprompt_text1 == None:
+        (ID2, congressmanName2, reprompt_text2) = resolve_member(intent, 'congressmanTwo', session_attributes,
+                                                                 currentMembers, lastMember)
 
     #First checks that both congressman were found
     if reprompt_text1 != None:
@@ -318,65 +1737,42 @@ def record_compare(intent, session, currentMembers):
         card_title, reprompt_text2, reprompt_text2, False))
 
 
-    #Then looks for each, so we know if they ever served at the same time
-    for element in currentMembers:
-        if element['id']['bioguide'] == ID1:
-            houseHistory1 = ''
-            for term in element['terms']:
-                if term['type'] == 'sen': houseHistory1 += 'S'
-                else: houseHistory1 += 'H'
-            continue
-        if element['id']['bioguide'] == ID2:
-            houseHistory2 = ''
-            for term in element['terms']:
-                if term['type'] == 'sen': houseHistory2 += 'S'
-                else: houseHistory2 += 'H'
+    #Then works out every congress, and which house, the two of them actually sat in together
+    sharedSessions = shared_service(currentMembers.byId[ID1], currentMembers.byId[ID2])
 
-    #This would mess up for senators who had a break in their service, but according to wikipedia that is such a rare
-    #occurence that this will work for now. To fix, also check the dates on each membership.
-    MAX_SEARCH_LENGTH = 3
-    minLength = min(len(houseHistory1), len(houseHistory2), MAX_SEARCH_LENGTH)
-    #this truncates each to only be as long as neccesary.
-    houseHistory1 = houseHistory1[-minLength:]
-    houseHistory2 = houseHistory2[-minLength:]
-
-
-    
     totalVotesShared = 0
     votesDisagree = 0
-    #loops through all congresses that they were both in. Will just skip to the return if one wasn't found.
-    for num in range(0, minLength):
-        #skips this iteration if they weren't in the same house during these years
-        if houseHistory1[-(num + 1)] != houseHistory2[-(num + 1)]:
-            continue
-        
-        if houseHistory1[-(num + 1)] == 'H':
-            house = 'house'
-        else:
-            house = 'senate'
-
-
-        #This does the actual work of counting the shared votes
-        response = Request("https://api.propublica.org/congress/v1/members/{0}/votes/{1}/{2}/{3}.json".format(
-            ID1, ID2, 115 - num, house), headers={"X-API-Key" : "DIl7ejWZz5ajxyzYyOjDN89YLp1xekEb1mjWkjq1"})
-        response = urlopen(response)
-        votes = json.load(response)
-
-        totalVotesShared = totalVotesShared + votes['results'][0]['common_votes']
-        votesDisagree = votesDisagree + votes['results'][0]['disagree_votes']
-
-    if totalVotesShared == 0:
-        speech_output = '{0} and {1} have never voted on the same issue, most likely because they weren\'t' \
-                ' in the same house of congress at the same time'.format(congressmanName1, congressmanName2)
+    #This does the actual work of counting the shared votes, fetching every congress at once
+    #(apart from any this conversation has already fetched)
+    known = dict((entry[0], tuple(entry[1:])) for entry in session_attributes.get('comparisons', []))
+    remembered = dict(known)
+    comparisons = fetch_vote_comparisons(ID1, ID2, sharedSessions, remembered=remembered)
+    for key in sorted(set(remembered) - set(known)):
+        remember(session_attributes, 'comparisons', [key] + list(remembered[key]), SESSION_COMPARISONS_LIMIT)
+    for (commonVotes, disagreeVotes) in comparisons:
+        totalVotesShared = totalVotesShared + commonVotes
+        votesDisagree = votesDisagree + disagreeVotes
+
+    #sessions too old for any vote source can't be compared, however often the user asks
+    recordedSessions = [(congress, house) for (congress, house) in sharedSessions if votes_recorded(congress, house)]
+    if len(sharedSessions) != 0 and len(recordedSessions) == 0:
+        speech_output = u'I\'m sorry, {0} and {1} only served together before the voting records I have begin, ' \
+                u'so I can\'t compare how they voted.'.format(congressmanName1, congressmanName2)
+    elif len(recordedSessions) != 0 and len(comparisons) == 0:
+        speech_output = u'I\'m sorry, I couldn\'t reach the voting records for {0} and {1} right now. ' \
+                u'Please try again in a moment.'.format(congressmanName1, congressmanName2)
+    elif totalVotesShared == 0:
+        speech_output = u'{0} and {1} have never voted on the same issue, most likely because they weren\'t' \
+                u' in the same house of congress at the same time'.format(congressmanName1, congressmanName2)
     else:
         percentage = 100 * (totalVotesShared - votesDisagree) / float(totalVotesShared)
         percentage = '%.0f' % percentage
-        speech_output = '{0} and {1} have voted on the same issue {2} times, ' \
-                'and agreed about {3} percent of the time.'.format(
+        speech_output = u'{0} and {1} have voted on the same issue {2} times, ' \
+                u'and agreed about {3} percent of the time.'.format(
                 congressmanName1, congressmanName2, totalVotesShared, percentage)
 
     return build_response(session_attributes, build_speechlet_response(
-        card_title, speech_output, reprompt_text1, should_end_session))
+        card_title, speech_output, FOLLOW_UP_REPROMPT, should_end_session))
 
     
 
@@ -410,39 +1806,72 @@ def on_intent(intent_request, session):
     intent = intent_request['intent']
     intent_name = intent_request['intent']['name']
 
-    with open('current_members.json') as data:
-        currentMembers = json.load(data)
+    with timing().phase('load'):
+        currentMembers = CURRENT_MEMBERS.get()
 
 
     # Dispatch to your skill's intent handlers
     # Each block here first checks for valid input, and ensures no empty values
+    #a name left out means whoever the conversation was last about, if it was about anyone
+    slots = intent.get('slots', {})
+    lastMember = remembered_member(session, currentMembers)
+
     if intent_name == "generalRecordCheck":
-        if 'value' not in intent['slots']['congressman']:
+        if 'value' not in slots.get('congressman', {}) and lastMember is None:
             speech_output = 'I\'m sorry, I didn\'t catch a name in that question. Please try again.'
-            return build_response({}, build_speechlet_response(
+            return build_response(session_state(session), build_speechlet_response(
                 'Error', speech_output, None, False))
         return general_record_check(intent, session, currentMembers)
 
     elif intent_name == "indivCommitteeCheck":
-        if 'value' not in intent['slots']['congressman']:
+        if 'value' not in slots.get('congressman', {}) and lastMember is None:
             speech_output = 'I\'m sorry, I didn\'t catch a name in that question. Please try again.'
-            return build_response({}, build_speechlet_response(
+            return build_response(session_state(session), build_speechlet_response(
                 'Error', speech_output, None, False))
         return individual_committee_check(intent, session, currentMembers)
 
     elif intent_name == "recordCompare":
-        if 'value' not in intent['slots']['congressmanOne'] or 'value' not in intent['slots']['congressmanTwo']:
+        heard = [slot for slot in ('congressmanOne', 'congressmanTwo') if 'value' in slots.get(slot, {})]
+        if len(heard) == 0 or (len(heard) == 1 and lastMember is None):
             speech_output = 'I\'m sorry, I only heard the name of one congressman. Please try again.'
-            return build_response({}, build_speechlet_response(
+            return build_response(session_state(session), build_speechlet_response(
                 'Error', speech_output, None, False))
         return record_compare(intent, session, currentMembers)
 
+    elif intent_name == "mostAlignedCheck":
+        if 'value' not in slots.get('congressman', {}) and lastMember is None:
+            speech_output = 'I\'m sorry, I didn\'t catch a name in that question. Please try again.'
+            return build_response(session_state(session), build_speechlet_response(
+                'Error', speech_output, None, False))
+        return most_aligned_check(intent, session, currentMembers)
+
+    elif intent_name == "committeeAlignmentCheck":
+        if 'value' not in slots.get('committee', {}):
+            speech_output = 'I\'m sorry, I didn\'t catch a committee in that question. Please try again.'
+            return build_response(session_state(session), build_speechlet_response(
+                'Error', speech_output, None, False))
+        return committee_alignment_check(intent, session, currentMembers)
+
+    elif intent_name == "chooseCandidate":
+        if 'value' not in slots.get('state', {}):
+            speech_output = 'I\'m sorry, I didn\'t catch which state you meant. Please try again.'
+            return build_response(session_state(session), build_speechlet_response(
+                'Error', speech_output, speech_output, False))
+        return choose_candidate(intent, session, currentMembers)
+
     elif intent_name == "AMAZON.HelpIntent":
         return get_help_response()
 
-    elif intent_name == "AMAZON.CancelIntent" or intent_name == "AMAZON.StopIntent":
+    elif intent_name == "AMAZON.CancelIntent" or intent_name == "AMAZON.StopIntent" or \
+            intent_name == "AMAZON.NoIntent":
         return handle_session_end_request()
 
+    elif intent_name == "AMAZON.YesIntent":
+        return get_follow_up_response(session)
+
+    elif intent_name == "AMAZON.FallbackIntent":
+        return get_fallback_response(session)
+
     else:
         raise ValueError("Invalid intent")
 
@@ -475,19 +1904,135 @@ def lambda_handler(event, context):
      #        "amzn1.ask.skill.ef0a117c-a47d-4ca5-97d3-570f9383c01a"):
      #    raise ValueError("Invalid Application ID")
 
-    if event['session']['new']:
-        on_session_started({'requestId': event['request']['requestId']},
-                           event['session'])
+    requestTiming = start_timing(event)
+    try:
+        if event['session']['new']:
+            on_session_started({'requestId': event['request']['requestId']},
+                               event['session'])
 
-    if event['request']['type'] == "LaunchRequest":
-        return on_launch(event['request'], event['session'])
-    elif event['request']['type'] == "IntentRequest":
-        return on_intent(event['request'], event['session'])
-    elif event['request']['type'] == "SessionEndedRequest":
-        return on_session_ended(event['request'], event['session'])
+        if event['request']['type'] == "LaunchRequest":
+            return on_launch(event['request'], event['session'])
+        elif event['request']['type'] == "IntentRequest":
+            return on_intent(event['request'], event['session'])
+        elif event['request']['type'] == "SessionEndedRequest":
+            return on_session_ended(event['request'], event['session'])
+    finally:
+        finish_timing(requestTiming)
 
 
+# --------------- Batch handler ------------------
 
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', 8))
+#the slots each intent a batch can ask takes, all of them required
+BATCH_INTENTS = {
+    "generalRecordCheck": ('congressman',),
+    "indivCommitteeCheck": ('congressman',),
+    "recordCompare": ('congressmanOne', 'congressmanTwo'),
+    "mostAlignedCheck": ('congressman',),
+    "committeeAlignmentCheck": ('committee',),
+}
 
 
+def batch_query_error(query):
+    '''
+    Why a batch query can't be asked, or None if it can.
+    '''
+    if not isinstance(query, dict):
+        return "a query must be an object, not {0!r}".format(query)
+    slots = BATCH_INTENTS.get(query.get('intent'))
+    if slots is None:
+        return "unknown intent {0!r}".format(query.get('intent'))
+    if any(not isinstance(query.get(slot), basestring) for slot in slots):
+        return "{0} needs {1}".format(query['intent'], ', '.join(slots))
+    return None
+
 
+def prefetch_vote_comparisons(queries, currentMembers):
+    '''
+    Gathers every vote comparison the recordCompare queries (all already checked) will need, each distinct
+    pair, congress and house once: from VOTE_CACHE where it has them, and from upstream on up to
+    BATCH_CONCURRENCY threads where it doesn't. Comparisons a local roll-call matrix can answer are skipped,
+    and failures are left for record_compare to retry.
+    Returns {query number: [[comparison_name(), common votes, disagree votes], ...]}, in the shape
+    record_compare reads from sessionAttributes, so a big batch can't evict its own results from VOTE_CACHE
+    before it gets to use them.
+    '''
+    wanted = {}
+    byQuery = {}
+    for number, query in enumerate(queries):
+        if query['intent'] != "recordCompare":
+            continue
+        IDs = [getCongressId({'slots': {}}, query[slot], currentMembers)
+               for slot in ('congressmanOne', 'congressmanTwo')]
+        if IDs[0][1] is not None or IDs[1][1] is not None:
+            continue
+        (ID1, ID2) = (IDs[0][0], IDs[1][0])
+        for (congress, house) in shared_service(currentMembers.byId[ID1], currentMembers.byId[ID2]):
+            if congress < PROPUBLICA_FIRST_CONGRESS[house]:
+                continue
+            if VOTE_SOURCE == 'local' and load_vote_matrix(congress, house) is not None:
+                continue
+            name = comparison_name(ID1, ID2, congress, house)
+            wanted[name] = (ID1, ID2, congress, house)
+            byQuery.setdefault(number, []).append(name)
+
+    results = {}
+    pending = Queue.Queue()
+    for name, comparison in wanted.items():
+        cached = VOTE_CACHE.get(comparison_key(*comparison))
+        if cached is not None:
+            results[name] = cached
+        else:
+            pending.put((name, comparison))
+    fetching = pending.qsize()
+
+    def worker():
+        while True:
+            try:
+                (name, (ID1, ID2, congress, house)) = pending.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                results[name] = fetch_vote_comparison(ID1, ID2, congress, house)
+            except (IOError, ValueError, KeyError, IndexError) as error:
+                print("batch prefetch failed for {0}/{1} in {2} {3}: {4!r}".format(ID1, ID2, congress, house, error))
+
+    threads = [threading.Thread(target=worker) for number in range(min(BATCH_CONCURRENCY, fetching))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    print("batch needs {0} comparisons, {1} fetched".format(len(wanted), fetching))
+
+    return dict((number, [[name] + list(results[name]) for name in names if name in results])
+                for number, names in byQuery.items())
+
+
+def batch_handler(event, context):
+    '''
+    A second entry point, for nightly reports and dashboards that ask many questions at once.
+    event['queries'] is a list of queries, each an intent name and its slot values, like
+        {'intent': 'recordCompare', 'congressmanOne': 'Chuck Grassley', 'congressmanTwo': 'Dianne Feinstein'}
+    The result is {'results': [...]}, holding for each query, in order, the response the skill
+    would have given, or {'error': ...} if the query couldn't be asked.
+    Each distinct name is resolved once and every upstream fetch the batch needs is made up front,
+    once and concurrently, so the queries themselves are answered from memory.
+    '''
+    queries = event['queries']
+    if not isinstance(queries, list):
+        raise ValueError("queries must be a list")
+    errors = [batch_query_error(query) for query in queries]
+    currentMembers = CURRENT_MEMBERS.get()
+    valid = [(number, query) for number, query in enumerate(queries) if errors[number] is None]
+    prefetched = prefetch_vote_comparisons([query for number, query in valid], currentMembers)
+    print("batch of {0} queries, {1} of them valid".format(len(queries), len(valid)))
+
+    results = [{'error': error} for error in errors]
+    for position, (number, query) in enumerate(valid):
+        slots = BATCH_INTENTS[query['intent']]
+        intent = {'name': query['intent'],
+                  'slots': dict((slot, {'name': slot, 'value': query[slot]}) for slot in slots)}
+        session = {'sessionId': 'batch', 'new': False,
+                   'attributes': {'comparisons': prefetched[position]} if position in prefetched else {}}
+        results[number] = on_intent({'requestId': 'batch-{0}'.format(number), 'intent': intent}, session)
+    return {'results': results}
@@ -0,0 +1,188 @@
+"""
+Refreshes the member and committee data the skill answers from, without redeploying it.
+Pulls current_members.json and committee_members.json from SOURCE (a directory, or any URL urllib2 can open,
+file:// included), works out which members and committees changed since the data the current snapshot
+was built from, and patches only their entries in the snapshot's indexes.
+
+The result is the snapshot's next serial, written beside it and renamed over it. Point DATA_SNAPSHOT
+at the same shared path in the function, and warm containers swap to the new data on their
+next request (DataFile notices the new mtime), with no cold start. The snapshot is plain JSON, so it
+can't carry code, but it is what the skill answers from: keep the path writable by this job alone
+(the function refuses a world-writable snapshot).
+
+The raw files each refresh pulled are kept in --state, to diff the next refresh against; the first one
+diffs against the JSON deployed with the function. If the state doesn't match the snapshot, or --full
+is given, the indexes are rebuilt from scratch instead. --verify builds them from scratch as well as
+patching them, and writes nothing if the two answer differently.
+
+    python refresh_data.py SOURCE [--output data_snapshot.json] [--state refresh_state] [--full] [--verify]
+"""
+
+from __future__ import print_function
+import argparse
+import hashlib
+import io
+import json
+import os
+import urllib
+import urllib2
+import urlparse
+
+import lambda_function
+
+
+STATE_DIR = os.path.join(lambda_function.DATA_DIR, 'refresh_state')
+
+#snapshot key, file, the index built from it, how to stream the file into it, and how to key its raw records
+DATASETS = (
+    ('currentMembers', 'current_members.json', lambda_function.MemberIndex, lambda_function.iter_members,
+     lambda members: dict((element['id']['bioguide'], element) for element in members)),
+    ('committeeMembers', 'committee_members.json', lambda_function.CommitteeIndex, lambda_function.iter_committees,
+     lambda committees: committees),
+)
+
+
+def source_url(source):
+    if '://' not in source:
+        source = urlparse.urljoin('file:', urllib.pathname2url(os.path.abspath(source)))
+    return source.rstrip('/') + '/'
+
+
+def fetch(source, filename):
+    response = urllib2.urlopen(urlparse.urljoin(source_url(source), filename), timeout=30)
+    try:
+        return response.read()
+    finally:
+        response.close()
+
+
+def read_previous(state, filename):
+    '''
+    The raw file the last refresh pulled, or the deployed one if there hasn't been a refresh yet.
+    '''
+    for directory in (state, lambda_function.DATA_DIR):
+        path = os.path.join(directory, filename)
+        if os.path.exists(path):
+            with open(path, 'rb') as data:
+                return data.read()
+    return None
+
+
+def read_snapshot(path):
+    try:
+        with open(path, 'rb') as data:
+            return lambda_function.load_snapshot(data)
+    except IOError:
+        return {}
+
+
+def diff(previous, current):
+    '''
+    (removed, added) between two dicts of raw records; a record that changed is in both.
+    '''
+    removed = dict((key, record) for key, record in previous.items() if current.get(key) != record)
+    added = dict((key, record) for key, record in current.items() if previous.get(key) != record)
+    return (removed, added)
+
+
+def answers(currentMembers, name):
+    #what getCongressId would say about name; members new since a full build sit at the end of a patched index,
+    #so candidates are compared regardless of order
+    (found, reprompt_text) = lambda_function.lookup_congress_id({'slots': {}}, name, currentMembers)
+    return (found if isinstance(found, basestring) else sorted(found), reprompt_text is None)
+
+
+def seats(committeeMembers, ID):
+    return sorted((assignment.committee, assignment.rank, assignment.title, assignment.party)
+                  for assignment in committeeMembers.assignments(ID))
+
+
+def verify(refreshed, pulled):
+    '''
+    Differences between refreshed's indexes and ones built from scratch out of the pulled files:
+    their member records, who every name any of the name tables holds resolves to, and everyone's committee seats.
+    '''
+    scratch = dict((name, build(stream(io.BytesIO(pulled[filename]))))
+                   for name, filename, build, stream, records in DATASETS)
+    differences = []
+    (patched, built) = (refreshed['currentMembers'], scratch['currentMembers'])
+    for ID in set(patched.byId) | set(built.byId):
+        if ID not in patched.byId or ID not in built.byId or patched.byId[ID].dump() != built.byId[ID].dump():
+            differences.append("member " + ID)
+    names = set()
+    for index in (patched, built):
+        for table in (index.exact, index.first, index.last, index.nickname):
+            names.update(table)
+    for name in sorted(names):
+        if answers(patched, name) != answers(built, name):
+            differences.append(u"name " + name)
+    (patched, built) = (refreshed['committeeMembers'], scratch['committeeMembers'])
+    for ID in set(patched.byMember) | set(built.byMember):
+        if seats(patched, ID) != seats(built, ID):
+            differences.append("committee seats of " + ID)
+    return differences
+
+
+def refresh(source, output, state, full, check):
+    snapshot = read_snapshot(output)
+    if not snapshot and not full:
+        print("no usable snapshot at {0}, building from scratch".format(output))
+        full = True
+
+    refreshed = {
+        'version': lambda_function.SNAPSHOT_VERSION,
+        'sources': {},
+        'base': lambda_function.bundled_digests(),
+        'serial': snapshot.get('serial', 0) + 1,
+    }
+    pulled = {}
+    for name, filename, build, stream, records in DATASETS:
+        contents = pulled[filename] = fetch(source, filename)
+        digest = refreshed['sources'][filename] = hashlib.sha1(contents).hexdigest()
+        if not full and snapshot['sources'].get(filename) == digest:
+            print("{0}: unchanged".format(filename))
+            refreshed[name] = snapshot[name]
+            continue
+
+        previous = None if full else read_previous(state, filename)
+        if previous is None or hashlib.sha1(previous).hexdigest() != snapshot['sources'].get(filename):
+            refreshed[name] = build(stream(io.BytesIO(contents)))
+            print("{0}: rebuilt from scratch".format(filename))
+            continue
+
+        (removed, added) = diff(records(json.loads(previous)), records(json.loads(contents)))
+        snapshot[name].update(removed, added)
+        refreshed[name] = snapshot[name]
+        print("{0}: {1} removed or changed, {2} added or changed".format(filename, len(removed), len(added)))
+
+    if not full and refreshed['sources'] == snapshot['sources']:
+        print("{0} is already up to date (serial {1})".format(output, snapshot['serial']))
+        return
+
+    if check:
+        differences = verify(refreshed, pulled)
+        if differences:
+            raise SystemExit(u"patched indexes differ from a full build, not writing {0}: {1}".format(
+                output, u', '.join(differences)).encode('utf-8'))
+        print("patched indexes match a full build")
+
+    lambda_function.write_atomically(output, lambda data: data.write(lambda_function.dump_snapshot(refreshed)))
+    #kept after the snapshot, so a run that dies between the two is caught by the digest check next time
+    for filename, contents in pulled.items():
+        lambda_function.write_atomically(os.path.join(state, filename), lambda data: data.write(contents))
+    print("wrote {0}: serial {1} ({2} bytes)".format(output, refreshed['serial'], os.path.getsize(output)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('source', help="directory or URL holding current_members.json and committee_members.json")
+    parser.add_argument('--output', default=lambda_function.SNAPSHOT.path)
+    parser.add_argument('--state', default=STATE_DIR, help="where the raw files of the last refresh are kept")
+    parser.add_argument('--full', action='store_true', help="rebuild every index instead of patching")
+    parser.add_argument('--verify', action='store_true', help="check the patched indexes against a full build")
+    args = parser.parse_args()
+    refresh(args.source, args.output, args.state, args.full, args.verify)
+
+
+if __name__ == '__main__':
+    main()
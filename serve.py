@@ -0,0 +1,222 @@
+"""
+Serves the skill over HTTP, for running it on our own hosts behind a load balancer instead of in Lambda.
+    POST /         an Alexa request envelope, answered through lambda_handler (so the same
+                   on_launch / on_intent routing) with the response envelope as JSON
+    POST /batch    a batch_handler event, {'queries': [...]}
+    GET  /health   200 once the worker is up, for the load balancer's health check
+
+The shared indexes are loaded once, when this imports lambda_function, and the listening socket is
+opened once; then --workers processes are forked to accept from it, so every worker starts with the
+indexes already built. Within a worker each request gets its own thread, so a comparison waiting on
+ProPublica holds up no other request (and its per-congress fetches still run concurrently).
+A worker that dies is replaced; SIGTERM or SIGINT stops them all.
+
+TLS and verifying Alexa's request signatures are left to the load balancer in front.
+
+    python serve.py [--host 0.0.0.0] [--port 8080] [--workers 4]
+"""
+
+from __future__ import print_function
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import signal
+import sys
+import traceback
+
+import lambda_function
+
+
+#the most a request body may be, which is far more than any Alexa request (or sensible batch) needs
+MAX_BODY = 1 << 20
+
+
+def skill_request_error(event):
+    '''
+    What's wrong with an Alexa request envelope, or None if lambda_handler can take it.
+    Only what the handlers read without checking is checked here. An intent they don't know is left to
+    them and answered 500, as it means the skill's interaction model and this code disagree.
+    '''
+    session = event.get('session')
+    request = event.get('request')
+    if not isinstance(session, dict) or not isinstance(request, dict):
+        return "session and request must be objects"
+    application = session.get('application')
+    if not isinstance(application, dict) or not isinstance(application.get('applicationId'), basestring):
+        return "session.application.applicationId must be a string"
+    if not isinstance(session.get('new'), bool):
+        return "session.new must be true or false"
+    if not isinstance(session.get('attributes') or {}, dict):
+        return "session.attributes must be an object"
+    for (part, name, field) in ((session, 'session', 'sessionId'), (request, 'request', 'requestId'),
+                                (request, 'request', 'type')):
+        if not isinstance(part.get(field), basestring):
+            return "{0}.{1} must be a string".format(name, field)
+
+    if request['type'] != "IntentRequest":
+        return None
+    intent = request.get('intent')
+    if not isinstance(intent, dict) or not isinstance(intent.get('name'), basestring):
+        return "request.intent.name must be a string"
+    slots = intent.get('slots', {})
+    if not isinstance(slots, dict) or not all(isinstance(slot, dict) for slot in slots.values()):
+        return "request.intent.slots must be an object of objects"
+    if not all(isinstance(slot['value'], basestring) for slot in slots.values() if 'value' in slot):
+        return "slot values must be strings"
+    return None
+
+
+def batch_request_error(event):
+    #each query is checked by batch_handler, which answers a bad one with an error in its place
+    if not isinstance(event.get('queries'), list):
+        return "queries must be a list"
+    return None
+
+
+class SkillServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class SkillHandler(BaseHTTPRequestHandler):
+    '''
+    Speaks HTTP/1.1, so the load balancer can keep connections to each worker alive.
+    '''
+    protocol_version = 'HTTP/1.1'
+    #the headers and body go out in separate writes; with Nagle on, the body of every response after
+    #the first on a connection waits for the client's delayed ACK, some 40 ms
+    disable_nagle_algorithm = True
+    #path -> (handler, what's wrong with a body it can't take)
+    routes = {
+        '/': (lambda_function.lambda_handler, skill_request_error),
+        '/batch': (lambda_function.batch_handler, batch_request_error),
+    }
+
+    def do_GET(self):
+        if self.path != '/health':
+            return self.respond(404, {'error': "not found"})
+        self.respond(200, {'status': 'ok'})
+
+    def do_POST(self):
+        if self.path not in self.routes:
+            return self.respond(404, {'error': "not found"})
+        (handler, request_error) = self.routes[self.path]
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            length = -1
+        if length < 0 or length > MAX_BODY:
+            return self.respond(400, {'error': "bad Content-Length"})
+
+        try:
+            event = json.loads(self.rfile.read(length))
+        except ValueError:
+            return self.respond(400, {'error': "body is not JSON"})
+        error = request_error(event) if isinstance(event, dict) else "body is not a JSON object"
+        if error is not None:
+            return self.respond(400, {'error': "bad request: " + error})
+
+        #the request is well formed, so anything the handler raises is ours to fix
+        try:
+            response = handler(event, None)
+        except Exception:
+            traceback.print_exc()
+            return self.respond(500, {'error': "internal error"})
+        if response is None and self.path == '/' and event['request']['type'] == "SessionEndedRequest":
+            #Alexa sends one whenever a session closes, and wants no speech back, only an answer
+            response = {'version': '1.0', 'response': {}}
+        if response is None:
+            return self.respond(400, {'error': "unknown request type"})
+        self.respond(200, response)
+
+    def respond(self, status, body):
+        body = json.dumps(body)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json;charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        #lambda_handler already prints a line per request, as it does into CloudWatch
+        pass
+
+
+def run_worker(server):
+    #every worker accepts from the one listening socket, so most lose the race for each connection;
+    #non-blocking, the losers' accept fails at once (which SocketServer ignores) instead of stalling them
+    server.socket.setblocking(False)
+    status = 1
+    try:
+        server.serve_forever()
+        status = 0
+    finally:
+        os._exit(status)
+
+
+def serve(server, workers):
+    '''
+    Forks workers to serve from server's socket, replacing any that die, until told to stop.
+    '''
+    children = set()
+    stopping = []
+
+    def stop(signum, frame):
+        stopping.append(signum)
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            #else every worker draws the same "random" numbers as the others, timing samples included
+            random.seed()
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            run_worker(server)
+        children.add(pid)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for number in range(workers):
+        spawn()
+
+    while children:
+        try:
+            (pid, status) = os.wait()
+        except OSError:
+            #interrupted by a signal, go round and wait again
+            continue
+        children.discard(pid)
+        if not stopping:
+            print("worker {0} exited with status {1}, starting another".format(pid, status))
+            spawn()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(),
+                        help="processes to fork, 1 to serve from this one (defaults to one per core)")
+    args = parser.parse_args()
+
+    server = SkillServer((args.host, args.port), SkillHandler)
+    print("serving on {0}:{1} with {2} worker(s), data loaded in {3} ms".format(
+        args.host, server.server_port, args.workers, lambda_function.INIT_LOAD_MS))
+    sys.stdout.flush()
+    if args.workers <= 1:
+        server.serve_forever()
+    else:
+        serve(server, args.workers)
+
+
+if __name__ == '__main__':
+    main()